@@ -1,8 +1,8 @@
 # -*- coding: utf-8 -*-
 {
     'name': "APLUS",
-    'version': '18.0.1.0',
-    'depends': ['base','stock','sale_management','hr','hr_contract','hr_payroll'],
+    'version': '18.0.1.1',
+    'depends': ['base','bus','stock','sale_management','hr','hr_contract','hr_payroll'],
     'author': "Author Name",
     'category': 'Category',
     'license': 'LGPL-3',
@@ -19,14 +19,21 @@
   
     'data': [
         'security/ir.model.access.csv',
+        'security/security.xml',
+
+        'data/ir_cron.xml',
         
         'views/stock_picking.xml',
         'views/hr_employee.xml',
         'views/hr_contract.xml',
+        'views/report_job.xml',
+        'views/report_execution_log.xml',
+        'views/client_stock_ledger.xml',
+        'views/stock_snapshot.xml',
         
         'wizard/stock_management_report_wizard_view.xml',
       ],
-    'install_requires':['openpyxl'],
+    'install_requires':['xlsxwriter'],
     'auto_install': False,
     'installable': True,
     'application': True,
@@ -0,0 +1,23 @@
+# -*- coding: utf-8 -*-
+
+from odoo import http
+from odoo.http import request
+
+from ..models.ir_attachment import REPORT_OUTPUT_DESCRIPTION
+
+
+class ReportDownload(http.Controller):
+
+    @http.route('/aplus/report/<int:attachment_id>', type='http', auth='user', readonly=True)
+    def download_report(self, attachment_id, **kwargs):
+        """ Send a generated report file.
+
+        The file is streamed from the filestore in chunks instead of being
+        decoded from base64 in memory. The attachment checksum is used as ETag,
+        so repeated downloads of an unchanged file get a 304 response.
+        """
+        attachment = request.env['ir.binary']._find_record(res_model='ir.attachment', res_id=attachment_id)
+        if attachment.description != REPORT_OUTPUT_DESCRIPTION:
+            raise request.not_found()
+        stream = request.env['ir.binary']._get_stream_from(attachment)
+        return stream.get_response(as_attachment=True)
@@ -1,5 +1,22 @@
 # -*- coding: utf-8 -*-
 
+from . import ir_attachment
+from . import report_cache
+from . import report_job
+from . import report_execution_log
 from . import stock_picking
+from . import stock_move
+from . import stock_move_line
+from . import sale_order
+from . import client_stock_ledger
+from . import stock_quant
+from . import stock_snapshot
+from . import product_product
 from . import hr_employee
-from . import hr_contract
\ No newline at end of file
+from . import hr_payslip
+from . import hr_payslip_line
+from . import hr_salary_rule
+from . import payroll_summary
+from . import hr_contract
+from . import report_diagnostics
+from . import report_benchmark
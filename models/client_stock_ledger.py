@@ -0,0 +1,216 @@
+# -*- coding: utf-8 -*-
+
+import logging
+from datetime import timedelta
+
+from odoo import models, fields, api
+from odoo.exceptions import AccessError, UserError
+
+from ..tools.sql_stream import iter_query
+
+_logger = logging.getLogger(__name__)
+
+LEDGER_COLUMNS = """sale_order_id, partner_id, company_id, date_order, picking_id, picking_state,
+    is_first_open, product_id, demand_qty, owed_qty, reserved_qty, move_count, first_move_id,
+    held_qty, held_move_count"""
+# moves of the inventory held report: the moves without package of the delivery
+# (stock.picking's move_ids_without_package) with a booked quantity
+HELD_MOVE_CONDITION = """sm.product_uom_qty > 0
+    and (sm.package_level_id is null or not coalesce(spt.show_entire_packs, false))"""
+# key of the sale orders to refresh in cr.precommit.data
+PENDING_KEY = 'aplus.client.stock.ledger'
+
+
+class ClientStockLedger(models.Model):
+    """ Stock owed to customers, summed per open delivery of every confirmed
+    sale order and product.
+
+    Maintained from the stock moves, pickings and sale orders changed in a
+    transaction (the sale orders are refreshed right before it commits), so
+    the client stock reports can read it instead of the live documents.
+    """
+    _name = "aplus.client.stock.ledger"
+    _description = "Client Stock Ledger"
+    _log_access = False
+
+    sale_order_id = fields.Many2one("sale.order", "Sale Order", required=True, index=True, ondelete="cascade")
+    partner_id = fields.Many2one("res.partner", "Customer", index=True)
+    company_id = fields.Many2one("res.company", "Company")
+    date_order = fields.Datetime("Order Date", index=True)
+    picking_id = fields.Many2one("stock.picking", "Delivery", ondelete="cascade")
+    picking_state = fields.Char("Delivery Status")
+    is_first_open = fields.Boolean("First Open Delivery",
+        help="First open delivery of the sale order in the default picking order.")
+    product_id = fields.Many2one("product.product", "Product", index=True, ondelete="cascade")
+    demand_qty = fields.Float("Demand", digits='Product Unit of Measure')
+    owed_qty = fields.Float("Owed", digits='Product Unit of Measure')
+    reserved_qty = fields.Float("Reserved", digits='Product Unit of Measure')
+    move_count = fields.Integer("Moves")
+    first_move_id = fields.Integer("First Move")
+    held_qty = fields.Float("Held Demand", digits='Product Unit of Measure',
+        help="Demand of the moves counted by the inventory held report.")
+    held_move_count = fields.Integer("Held Moves")
+
+    def init(self):
+        self.env.cr.execute("select 1 from aplus_client_stock_ledger limit 1")
+        if not self.env.cr.fetchone():
+            self._rebuild()
+
+    @api.model
+    def _select_query(self, condition):
+        return f"""
+            with open_pickings as (
+                select sp.id, sp.sale_id, sp.state,
+                row_number() over (
+                    partition by sp.sale_id order by sp.priority desc, sp.scheduled_date asc, sp.id desc
+                ) = 1 as is_first_open
+                from stock_picking as sp
+                join sale_order as so on so.id = sp.sale_id
+                where so.state = 'sale' and sp.state != 'done' and {condition}
+            )
+            select so.id, so.partner_id, so.company_id, so.date_order, op.id, op.state, op.is_first_open,
+                sm.product_id, sum(sm.product_uom_qty), sum(sm.owed_qty),
+                coalesce(sum(sm.quantity) filter (where sm.state in ('assigned', 'partially_available')), 0),
+                count(*), min(sm.id),
+                coalesce(sum(sm.product_uom_qty) filter (where {HELD_MOVE_CONDITION}), 0),
+                count(*) filter (where {HELD_MOVE_CONDITION})
+            from open_pickings as op
+            join sale_order as so on so.id = op.sale_id
+            join stock_move as sm on sm.picking_id = op.id
+            left join stock_picking_type as spt on spt.id = sm.picking_type_id
+            group by so.id, op.id, op.state, op.is_first_open, sm.product_id
+        """
+
+    @api.model
+    def _rebuild(self):
+        """ Recompute the whole ledger from the open deliveries. """
+        self.env.flush_all()
+        self.env.cr.execute("delete from aplus_client_stock_ledger")
+        self.env.cr.execute(f"insert into aplus_client_stock_ledger ({LEDGER_COLUMNS}) {self._select_query('true')}")
+        _logger.info("Client stock ledger rebuilt with %s rows", self.env.cr.rowcount)
+
+    def action_rebuild(self):
+        if not self.env.user.has_group('stock.group_stock_manager'):
+            raise AccessError("Only inventory administrators can rebuild the client stock ledger.")
+        self._rebuild()
+
+    @api.model
+    def _refresh(self, sale_order_ids):
+        """ Recompute the ledger rows of the given sale orders. """
+        if not sale_order_ids:
+            return
+        self.env.flush_all()
+        sale_order_ids = tuple(sale_order_ids)
+        self.env.cr.execute("delete from aplus_client_stock_ledger where sale_order_id in %s", (sale_order_ids,))
+        self.env.cr.execute(
+            f"insert into aplus_client_stock_ledger ({LEDGER_COLUMNS}) {self._select_query('so.id in %s')}",
+            (sale_order_ids,),
+        )
+
+    @api.model
+    def _mark_pending(self, sale_order_ids):
+        """ Refresh the given sale orders when the transaction commits (or
+        before the ledger is read), once however many times they change. """
+        if not sale_order_ids:
+            return
+        pending = self.env.cr.precommit.data.setdefault(PENDING_KEY, set())
+        if not pending:
+            self.env.cr.precommit.add(self._refresh_pending)
+        pending.update(sale_order_ids)
+
+    @api.model
+    def _refresh_pending(self):
+        self.env.flush_all()
+        self._refresh(self.env.cr.precommit.data.pop(PENDING_KEY, set()))
+
+    @api.model
+    def check_consistency(self, raise_if_failed=True):
+        """ Compare the ledger with the live computation and return the ids of
+        the sale orders whose rows differ, raising when there are any (unless
+        ``raise_if_failed`` is False). """
+        self._refresh_pending()
+        self.env.cr.execute(f"""
+            with live ({LEDGER_COLUMNS}) as ({self._select_query('true')}),
+            ledger as (select {LEDGER_COLUMNS} from aplus_client_stock_ledger),
+            differences as ((select * from live except all select * from ledger)
+                union all (select * from ledger except all select * from live))
+            select distinct sale_order_id from differences
+        """)
+        sale_order_ids = [row[0] for row in self.env.cr.fetchall()]
+        if sale_order_ids:
+            _logger.warning("Client stock ledger differs from the live data for %d sale orders", len(sale_order_ids))
+            if raise_if_failed:
+                raise UserError(
+                    "The client stock ledger differs from the live data for the sale orders %s. "
+                    "Rebuild it to fix it." % ", ".join(map(str, sale_order_ids[:20])))
+        return sale_order_ids
+
+    # REPORT DATA
+    @api.model
+    def _get_client_stock_demand(self, start_date=None, end_date=None):
+        """ Same as the wizard's _get_client_stock_demand, from the ledger. """
+        self._refresh_pending()
+        conditions = ["l.is_first_open"]
+        params = []
+        if start_date and end_date:
+            conditions.append("l.date_order >= %s and l.date_order < %s")
+            params += [start_date, end_date + timedelta(days=1)]
+
+        query = f"""
+            select l.product_id, so.name, rp.name, sum(l.demand_qty), sum(l.move_count)
+            from aplus_client_stock_ledger as l
+            join sale_order as so on so.id = l.sale_order_id
+            join res_partner as rp on rp.id = l.partner_id
+            where {' and '.join(conditions)}
+            group by so.id, so.name, so.date_order, rp.name, l.product_id
+            order by so.date_order desc, so.id desc, min(l.first_move_id)
+        """
+
+        product_ids_demand = dict() # {product_id: {demand:value}}
+        customers_dict = dict()  # {product_id: {customer_name: count}}
+        sale_order_dict = dict() # {product_id: {sale_order: None}} (ordered set)
+
+        for product_id, sale_order, customer_name, demand, move_count in iter_query(self.env.cr, query, params):
+            if product_id not in product_ids_demand:
+                product_ids_demand[product_id] = {'demand': 0}
+                customers_dict[product_id] = {}
+                sale_order_dict[product_id] = {}
+
+            product_ids_demand[product_id]['demand'] += demand
+            customers = customers_dict[product_id]
+            customers[customer_name] = customers.get(customer_name, 0) + move_count
+            sale_order_dict[product_id][sale_order] = None
+
+        return product_ids_demand, customers_dict, sale_order_dict
+
+    @api.model
+    def _get_inventory_held_demand(self, start_date=None, end_date=None):
+        """ Return the booked quantity and the customers per product of the
+        reserved deliveries, like the wizard's inventory_held_data, from the
+        ledger: ({product_id: {'demand': qty}}, {product_id: {customer: count}}). """
+        self._refresh_pending()
+        conditions = ["l.picking_state = 'assigned'", "l.held_qty > 0"]
+        params = []
+        if start_date and end_date:
+            conditions.append("l.date_order >= %s and l.date_order <= %s")
+            params += [start_date, end_date]
+
+        query = f"""
+            select l.product_id, coalesce(rp.name, ''), l.held_qty, l.held_move_count
+            from aplus_client_stock_ledger as l
+            join stock_picking as sp on sp.id = l.picking_id
+            left join res_partner as rp on rp.id = l.partner_id
+            where {' and '.join(conditions)}
+            order by sp.priority desc, sp.scheduled_date asc, sp.id desc, l.first_move_id
+        """
+
+        product_ids_demand = {}     # {product_id: {'demand': qty}}
+        customers_dict = {}         # {product_id: {customer: count}}
+        for product_id, customer, demand, move_count in iter_query(self.env.cr, query, params):
+            if product_id not in product_ids_demand:
+                product_ids_demand[product_id] = {"demand": 0}
+                customers_dict[product_id] = {}
+            product_ids_demand[product_id]['demand'] += demand
+            customers_dict[product_id][customer] = customers_dict[product_id].get(customer, 0) + move_count
+
+        return product_ids_demand, customers_dict
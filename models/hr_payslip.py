@@ -0,0 +1,48 @@
+# -*- coding: utf-8 -*-
+
+from odoo import models, api
+from odoo.tools.sql import create_index
+
+from .payroll_summary import SUMMARY_STATES
+
+# payslip fields identifying a row of the payroll summary
+SUMMARY_KEY_FIELDS = ('state', 'employee_id', 'date_from', 'date_to', 'payslip_run_id')
+
+
+class HrPayslip(models.Model):
+    _inherit = "hr.payslip"
+
+    def init(self):
+        # payroll summary refresh: summarised payslips of given employee periods
+        states = ", ".join(f"'{state}'" for state in SUMMARY_STATES)
+        create_index(self.env.cr, 'hr_payslip_aplus_summary_period_idx', self._table,
+                     ['employee_id', 'date_from', 'date_to'], where=f"state in ({states})")
+        # payroll summary aggregation: payslip lines of a payslip, per salary rule
+        create_index(self.env.cr, 'hr_payslip_line_aplus_slip_rule_idx', 'hr_payslip_line',
+                     ['slip_id', 'salary_rule_id'])
+
+    def _get_summary_keys(self):
+        return {(slip.employee_id.id, slip.date_from, slip.date_to) for slip in self if slip.employee_id}
+
+    @api.model_create_multi
+    def create(self, vals_list):
+        payslips = super().create(vals_list)
+        summarised = payslips.filtered(lambda slip: slip.state in SUMMARY_STATES)
+        self.env['aplus.payroll.summary']._refresh(summarised._get_summary_keys())
+        return payslips
+
+    def write(self, vals):
+        if not any(field in vals for field in SUMMARY_KEY_FIELDS):
+            return super().write(vals)
+        # refresh both the periods the payslips leave and the ones they join
+        keys = self.filtered(lambda slip: slip.state in SUMMARY_STATES)._get_summary_keys()
+        res = super().write(vals)
+        keys |= self.filtered(lambda slip: slip.state in SUMMARY_STATES)._get_summary_keys()
+        self.env['aplus.payroll.summary']._refresh(keys)
+        return res
+
+    def unlink(self):
+        keys = self.filtered(lambda slip: slip.state in SUMMARY_STATES)._get_summary_keys()
+        res = super().unlink()
+        self.env['aplus.payroll.summary']._refresh(keys)
+        return res
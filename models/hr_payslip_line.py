@@ -0,0 +1,37 @@
+# -*- coding: utf-8 -*-
+
+from odoo import models, api
+
+from .payroll_summary import SUMMARY_STATES
+
+# payslip line fields copied or summed into the payroll summary
+SUMMARY_LINE_FIELDS = ('slip_id', 'salary_rule_id', 'code', 'name', 'amount')
+
+
+class HrPayslipLine(models.Model):
+    _inherit = "hr.payslip.line"
+
+    def _get_summary_keys(self):
+        return self.slip_id.filtered(lambda slip: slip.state in SUMMARY_STATES)._get_summary_keys()
+
+    @api.model_create_multi
+    def create(self, vals_list):
+        lines = super().create(vals_list)
+        self.env['aplus.payroll.summary']._refresh(lines._get_summary_keys())
+        return lines
+
+    def write(self, vals):
+        if not any(field in vals for field in SUMMARY_LINE_FIELDS):
+            return super().write(vals)
+        # refresh both the payslips the lines leave and the ones they join
+        keys = self._get_summary_keys()
+        res = super().write(vals)
+        keys |= self._get_summary_keys()
+        self.env['aplus.payroll.summary']._refresh(keys)
+        return res
+
+    def unlink(self):
+        keys = self._get_summary_keys()
+        res = super().unlink()
+        self.env['aplus.payroll.summary']._refresh(keys)
+        return res
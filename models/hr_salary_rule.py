@@ -0,0 +1,27 @@
+# -*- coding: utf-8 -*-
+
+from odoo import models
+
+# salary rule fields copied into the payroll summary (the code and name come from the payslip lines)
+SUMMARY_RULE_FIELDS = ('category_id', 'sequence')
+
+
+class HrSalaryRule(models.Model):
+    _inherit = "hr.salary.rule"
+
+    def write(self, vals):
+        res = super().write(vals)
+        if any(field in vals for field in SUMMARY_RULE_FIELDS):
+            self.env['aplus.payroll.summary']._refresh_rules(self.ids)
+        return res
+
+
+class HrSalaryRuleCategory(models.Model):
+    _inherit = "hr.salary.rule.category"
+
+    def write(self, vals):
+        res = super().write(vals)
+        if 'code' in vals:
+            rules = self.env['hr.salary.rule'].with_context(active_test=False).search([('category_id', 'in', self.ids)])
+            self.env['aplus.payroll.summary']._refresh_rules(rules.ids)
+        return res
@@ -0,0 +1,128 @@
+# -*- coding: utf-8 -*-
+
+import logging
+import mimetypes
+import os
+
+from odoo import models, fields, api
+from odoo.tools.sql import create_index
+
+from ..tools.profiler import report_count, report_phase
+from ..tools.report_file import file_checksum, iter_chunks
+
+_logger = logging.getLogger(__name__)
+
+REPORT_OUTPUT_DESCRIPTION = "aplus_report_output"
+# days a report file is kept unless a cache entry or a report job refers to it
+DEFAULT_RETENTION_DAYS = 7
+
+
+class IrAttachment(models.Model):
+    _inherit = "ir.attachment"
+
+    def init(self):
+        res = super().init()
+        # report outputs garbage collection
+        create_index(self.env.cr, 'ir_attachment_aplus_report_output_idx', self._table,
+                     ['create_date'], where=f"description = '{REPORT_OUTPUT_DESCRIPTION}'")
+        return res
+
+    @api.model
+    def _create_report_output(self, file_name, report_file, record=None):
+        """ Store a generated report file once.
+
+        ``report_file`` is a binary file; with a filestore it is copied there
+        chunk by chunk, so the report is never loaded in memory as a whole.
+
+        Unless it is linked to ``record``, the attachment is not linked to any
+        record, so only its creator (and administrators) can read it back.
+        """
+        report_phase('storing')
+        report_file.seek(0, os.SEEK_END)
+        report_count('bytes_produced', report_file.tell())
+
+        vals = {
+            'name': file_name,
+            'description': REPORT_OUTPUT_DESCRIPTION,
+            'mimetype': mimetypes.guess_type(file_name)[0] or 'application/octet-stream',
+        }
+        if record:
+            vals.update(res_model=record._name, res_id=record.id)
+
+        if self._storage() == 'db':
+            report_file.seek(0)
+            return self.create(dict(vals, raw=report_file.read()))
+
+        attachment = self.create(vals)
+        attachment._write_report_file(report_file)
+        return attachment
+
+    def _copy_report_output(self):
+        """ Return a copy of this report file owned by the current user, so it
+        is the only one (with administrators) able to read it. The copy
+        shares the stored content of the original. """
+        self.ensure_one()
+        source = self.sudo()
+        copy = self.sudo(False).create({
+            'name': source.name,
+            'description': REPORT_OUTPUT_DESCRIPTION,
+            'mimetype': source.mimetype,
+        })
+        copy.flush_recordset()
+        self.env.cr.execute("""
+            update ir_attachment as a
+            set store_fname = s.store_fname, checksum = s.checksum, file_size = s.file_size, db_datas = s.db_datas
+            from ir_attachment as s
+            where s.id = %s and a.id = %s
+        """, (self.id, copy.id))
+        copy.invalidate_recordset(['store_fname', 'checksum', 'file_size', 'db_datas'])
+        return copy
+
+    def _write_report_file(self, report_file):
+        """ Copy ``report_file`` into the filestore, the way _file_write stores
+        binary values, and point the attachment to it. """
+        self.ensure_one()
+        file_size, checksum = file_checksum(report_file)
+        fname = checksum[:2] + '/' + checksum
+        full_path = self._full_path(fname)
+        if not os.path.exists(full_path):
+            os.makedirs(os.path.dirname(full_path), exist_ok=True)
+            tmp_path = f"{full_path}.{os.getpid()}.tmp"
+            with open(tmp_path, 'wb') as target:
+                for chunk in iter_chunks(report_file):
+                    target.write(chunk)
+            os.replace(tmp_path, full_path)
+            self._mark_for_gc(fname)
+
+        # create() and write() drop these computed columns from their values
+        self.flush_recordset()
+        self.env.cr.execute("""
+            update ir_attachment
+            set store_fname = %s, checksum = %s, file_size = %s, db_datas = null
+            where id = %s
+        """, (fname, checksum, file_size, self.id))
+        self.invalidate_recordset(['store_fname', 'checksum', 'file_size', 'db_datas'])
+
+    def _get_report_download_action(self):
+        self.ensure_one()
+        return {
+            'type': 'ir.actions.act_url',
+            'url': f"/aplus/report/{self.id}",
+            'target': 'self',
+        }
+
+    @api.autovacuum
+    def _gc_report_outputs(self):
+        """ Delete the report files older than the retention that neither a
+        cache entry nor a report job refers to. """
+        days = int(self.env['ir.config_parameter'].sudo().get_param(
+            'aplus.report_output_days', DEFAULT_RETENTION_DAYS))
+        self.env.cr.execute("""
+            select a.id from ir_attachment as a
+            where a.description = %s and a.create_date < %s
+            and not exists (select 1 from aplus_report_cache as c where c.attachment_id = a.id)
+            and not exists (select 1 from aplus_report_job as j where j.attachment_id = a.id)
+        """, (REPORT_OUTPUT_DESCRIPTION, fields.Datetime.subtract(fields.Datetime.now(), days=days)))
+        attachments = self.sudo().browse([row[0] for row in self.env.cr.fetchall()])
+        attachments.unlink()
+        _logger.info("Report outputs: %d files older than %d days deleted", len(attachments), days)
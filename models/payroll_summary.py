@@ -0,0 +1,239 @@
+# -*- coding: utf-8 -*-
+
+import logging
+
+from odoo import models, fields, api
+from odoo.tools.sql import create_index
+
+from ..tools.payroll_dataset import DEDUCTION_CATEGORIES, SCHEDULE_EXCLUDED_CODES, EmployeePayroll, PayrollDataset
+from ..tools.sql_stream import iter_query
+
+_logger = logging.getLogger(__name__)
+
+# payslip states whose lines are summarised
+SUMMARY_STATES = ('done', 'paid')
+# payslips of the (employee_id, date_from, date_to) periods passed as parameter
+REFRESH_CONDITION = "(hr_pay.employee_id, hr_pay.date_from, hr_pay.date_to) in %s"
+
+
+class PayrollSummary(models.Model):
+    """ Done and paid payslip lines summed per employee, payslip period,
+    payslip batch and salary rule.
+
+    Maintained by hr.payslip when payslips enter or leave those states, and
+    by their lines and salary rules when those change, so payroll reports
+    read about one row per employee, month and rule instead of every
+    payslip line.
+    """
+    _name = "aplus.payroll.summary"
+    _description = "Payroll Monthly Summary"
+    _log_access = False
+
+    employee_id = fields.Many2one("hr.employee", "Employee", required=True, index=True, ondelete="cascade")
+    company_id = fields.Many2one("res.company", "Company")
+    month = fields.Date("Month", required=True)
+    date_from = fields.Date("Date From", required=True, index=True)
+    date_to = fields.Date("Date To", required=True)
+    payslip_run_id = fields.Many2one("hr.payslip.run", "Payslip Batch", index=True, ondelete="set null")
+    salary_rule_id = fields.Many2one("hr.salary.rule", "Salary Rule", ondelete="cascade")
+    code = fields.Char("Code")
+    name = fields.Char("Name")
+    category_code = fields.Char("Category Code")
+    rule_sequence = fields.Integer("Rule Sequence")
+    amount = fields.Float("Amount")
+    line_count = fields.Integer("Payslip Lines")
+
+    def init(self):
+        # refreshed per payslip period, read per period range
+        create_index(self.env.cr, 'aplus_payroll_summary_period_key_idx', self._table,
+                     ['employee_id', 'date_from', 'date_to'])
+        create_index(self.env.cr, 'aplus_payroll_summary_date_range_idx', self._table,
+                     ['date_from', 'date_to'])
+        self.env.cr.execute("select 1 from aplus_payroll_summary limit 1")
+        if not self.env.cr.fetchone():
+            self._rebuild()
+
+    @api.model
+    def _insert_query(self, condition):
+        return f"""
+            insert into aplus_payroll_summary (employee_id, company_id, month, date_from, date_to, payslip_run_id,
+                salary_rule_id, code, name, category_code, rule_sequence, amount, line_count)
+            select hr_pay.employee_id, hr_pay.company_id, date_trunc('month', hr_pay.date_from)::date,
+                hr_pay.date_from, hr_pay.date_to, hr_pay.payslip_run_id, hr_pay_line.salary_rule_id,
+                hr_pay_line.code, hr_pay_line.name, hr_cat.code, coalesce(hr_rule.sequence, 0),
+                sum(hr_pay_line.amount), count(*)
+            from hr_payslip as hr_pay
+            join hr_payslip_line as hr_pay_line on hr_pay.id = hr_pay_line.slip_id
+            left join hr_salary_rule as hr_rule on hr_pay_line.salary_rule_id = hr_rule.id
+            left join hr_salary_rule_category as hr_cat on hr_rule.category_id = hr_cat.id
+            where hr_pay.state in {SUMMARY_STATES} and {condition}
+            group by hr_pay.employee_id, hr_pay.company_id, hr_pay.date_from, hr_pay.date_to, hr_pay.payslip_run_id,
+                hr_pay_line.salary_rule_id, hr_pay_line.code, hr_pay_line.name, hr_cat.code, hr_rule.sequence
+        """
+
+    @api.model
+    def _rebuild(self):
+        """ Recompute the whole summary from the done payslips. """
+        self.env.flush_all()
+        self.env.cr.execute("delete from aplus_payroll_summary")
+        self.env.cr.execute(self._insert_query("true"))
+        _logger.info("Payroll summary rebuilt with %s rows", self.env.cr.rowcount)
+
+    @api.model
+    def _refresh(self, keys):
+        """ Recompute the summary of the given (employee_id, date_from, date_to)
+        payslip periods. """
+        if not keys:
+            return
+        self.env.flush_all()
+        keys = tuple(keys)
+        self.env.cr.execute("""
+            delete from aplus_payroll_summary
+            where (employee_id, date_from, date_to) in %s
+        """, (keys,))
+        self.env.cr.execute(
+            self._insert_query(REFRESH_CONDITION),
+            (keys,),
+        )
+
+    @api.model
+    def _refresh_rules(self, rule_ids):
+        """ Update the category code and sequence copied from the given salary
+        rules, which do not change how the lines are summed. """
+        if not rule_ids:
+            return
+        self.env.flush_all()
+        self.env.cr.execute("""
+            update aplus_payroll_summary as s
+            set category_code = hr_cat.code, rule_sequence = coalesce(hr_rule.sequence, 0)
+            from hr_salary_rule as hr_rule
+            left join hr_salary_rule_category as hr_cat on hr_rule.category_id = hr_cat.id
+            where s.salary_rule_id = hr_rule.id and hr_rule.id in %s
+        """, (tuple(rule_ids),))
+
+    @api.model
+    def _get_dataset_condition(self, date_from=None, date_to=None, payslip_run_id=None):
+        """ Return the (condition, params) on the summary rows ``s`` of a
+        payslip batch or, without batch, of the payslip periods within the
+        given dates (all of them without dates). """
+        if payslip_run_id:
+            return "s.payslip_run_id = %s", [payslip_run_id]
+        if date_from and date_to:
+            return "s.date_from >= %s and s.date_to <= %s", [date_from, date_to]
+        return "true", []
+
+    @api.model
+    def _get_dataset_queries(self, date_from=None, date_to=None, payslip_run_id=None):
+        """ Return the {name: (query, params)} reading the payroll dataset, see
+        _get_dataset_condition. """
+        condition, params = self._get_dataset_condition(date_from, date_to, payslip_run_id)
+
+        return {
+            # employees by name, with their open contract and bank account
+            'employees': (f"""
+                select hr_emp.id, hr_emp.staff_id, hr_emp.name, hr_dep.name->>'en_US', hr_emp.tax_payer_number,
+                hr_emp.rsa_pin, hr_emp.pfa_name, r_b.name, r_p_b.acc_number,
+                hr_con.wage, hr_con.employee_voluntary, hr_con.employer_voluntary
+                from hr_employee as hr_emp
+                left join hr_department as hr_dep on hr_emp.department_id = hr_dep.id
+                left join res_partner_bank as r_p_b on r_p_b.id = hr_emp.bank_account_id
+                left join res_bank as r_b on r_b.id = r_p_b.bank_id
+                left join lateral (
+                    select wage, employee_voluntary, employer_voluntary
+                    from hr_contract
+                    where employee_id = hr_emp.id and state = 'open'
+                    order by date_start desc, id desc
+                    limit 1
+                ) as hr_con on true
+                where hr_emp.id in (select s.employee_id from aplus_payroll_summary as s where {condition})
+                order by hr_emp.name, hr_emp.id
+            """, params),
+            # amounts per employee and rule, plus the totals per rule (employee grouped away)
+            'amounts': (f"""
+                select grouping(s.employee_id) as is_total, s.employee_id, s.name, s.code, s.category_code, sum(s.amount)
+                from aplus_payroll_summary as s
+                where {condition}
+                group by grouping sets ((s.employee_id, s.name, s.code, s.category_code), (s.name, s.code, s.category_code))
+            """, params),
+        }
+
+    @api.model
+    def _load_dataset(self, date_from=None, date_to=None, payslip_run_id=None):
+        """ Load the payslip facts of a payslip batch or, without batch, of the
+        payslip periods within the given dates (all of them without dates).
+
+        Every payroll report is rendered from the returned PayrollDataset, so
+        exporting several reports of a month reads the payslips only once.
+        """
+        queries = self._get_dataset_queries(date_from, date_to, payslip_run_id)
+        self.env.flush_all()
+        dataset = PayrollDataset()
+
+        for (employee_id, staff_id, name, department, tax_payer_number, rsa_pin, pfa_name,
+             bank_name, acc_number, wage, employee_voluntary, employer_voluntary) in iter_query(self.env.cr, *queries['employees']):
+            dataset.employees[employee_id] = EmployeePayroll(
+                employee_id=employee_id,
+                staff_id=staff_id or '',
+                name=name or '',
+                department=department or '',
+                tax_payer_number=tax_payer_number or '',
+                rsa_pin=rsa_pin or '',
+                pfa_name=pfa_name or '',
+                bank_name=bank_name or '',
+                acc_number=acc_number or '',
+                wage=wage or 0.0,
+                employee_voluntary=employee_voluntary or 0.0,
+                employer_voluntary=employer_voluntary or 0.0,
+            )
+
+        for is_total, employee_id, name, code, category_code, amount in iter_query(self.env.cr, *queries['amounts']):
+            if is_total:
+                dataset.rule_totals[name] = dataset.rule_totals.get(name, 0.0) + amount
+                dataset.rule_categories[(name, code)] = category_code
+                continue
+            employee = dataset.employees[employee_id]
+            employee.rules[name] = employee.rules.get(name, 0.0) + amount
+            if code:
+                employee.codes[code] = employee.codes.get(code, 0.0) + amount
+        return dataset
+
+    # PAYROLL SCHEDULE
+    @api.model
+    def _get_schedule_columns(self, date_from=None, date_to=None):
+        """ Return the Payroll Schedule columns of the period: the earning
+        line names, then the deduction ones, each sorted by name. """
+        condition, params = self._get_dataset_condition(date_from, date_to)
+        self.env.flush_all()
+        self.env.cr.execute(f"""
+            select s.name,
+            bool_or(coalesce(s.category_code, '') not in %s) as is_earning,
+            bool_or(coalesce(s.category_code, '') in %s) as is_deduction
+            from aplus_payroll_summary as s
+            where {condition} and coalesce(s.code, '') not in %s
+            group by s.name
+        """, [DEDUCTION_CATEGORIES, DEDUCTION_CATEGORIES, *params, SCHEDULE_EXCLUDED_CODES])
+        column_rows = self.env.cr.fetchall()
+        earning_columns = sorted(name for name, is_earning, is_deduction in column_rows if is_earning)
+        deduction_columns = sorted(name for name, is_earning, is_deduction in column_rows if is_deduction)
+        return earning_columns + deduction_columns
+
+    @api.model
+    def _get_schedule_query(self, columns, date_from=None, date_to=None):
+        """ Return the (query, params) pivoting the amounts of the period per
+        employee and column, with FILTER aggregates, and the grand total row
+        last (grouping set ()): (is_total, staff_id, name, department, *amounts). """
+        condition, params = self._get_dataset_condition(date_from, date_to)
+        amounts = "".join(
+            ", coalesce(sum(s.amount) filter (where s.name = %s), 0)" for __ in columns
+        )
+        query = f"""
+            select grouping(hr_emp.id) = 1 as is_total, hr_emp.staff_id, hr_emp.name,
+            coalesce(hr_dep.name->>'en_US', '') {amounts}
+            from aplus_payroll_summary as s
+            join hr_employee as hr_emp on s.employee_id = hr_emp.id
+            left join hr_department as hr_dep on hr_emp.department_id = hr_dep.id
+            where {condition}
+            group by grouping sets ((hr_emp.id, hr_emp.staff_id, hr_emp.name, hr_dep.name), ())
+            order by grouping(hr_emp.id), hr_emp.name, hr_emp.id
+        """
+        return query, [*columns, *params]
@@ -0,0 +1,60 @@
+# -*- coding: utf-8 -*-
+
+from collections import namedtuple
+
+from odoo import models, api
+from odoo.tools.lru import LRU
+
+# products kept in the report dimension cache of every worker
+PRODUCT_CACHE_SIZE = 20000
+
+ProductDimension = namedtuple('ProductDimension', ['default_code', 'name', 'category', 'description'])
+
+# {(database, language, product_id): (version, ProductDimension)}, shared by the requests of a worker
+_dimension_cache = LRU(PRODUCT_CACHE_SIZE)
+
+
+class ProductProduct(models.Model):
+    _inherit = "product.product"
+
+    @api.model
+    def _get_report_dimensions(self, product_ids):
+        """ Return {product_id: ProductDimension} of the given products, read
+        in bulk and kept in a per-worker LRU cache.
+
+        Cached entries are checked against the last write date of the
+        product, its template and its category, so a changed product is read
+        again on its next use.
+        """
+        if not product_ids:
+            return {}
+        self.env.flush_all()
+        self.env.cr.execute("""
+            select pp.id, greatest(pp.write_date, pt.write_date, pc.write_date)
+            from product_product as pp
+            join product_template as pt on pt.id = pp.product_tmpl_id
+            left join product_category as pc on pc.id = pt.categ_id
+            where pp.id in %s
+        """, (tuple(product_ids),))
+        versions = dict(self.env.cr.fetchall())
+
+        key_prefix = (self.env.cr.dbname, self.env.lang)
+        dimensions = {}
+        missing = []
+        for product_id, version in versions.items():
+            cached = _dimension_cache.get(key_prefix + (product_id,))
+            if cached and cached[0] == version:
+                dimensions[product_id] = cached[1]
+            else:
+                missing.append(product_id)
+
+        for product in self.browse(missing):
+            dimension = ProductDimension(
+                default_code=product.default_code or "",
+                name=product.name or "",
+                category=product.categ_id.name or "",
+                description=product.description_sale or "",
+            )
+            _dimension_cache[key_prefix + (product.id,)] = (versions[product.id], dimension)
+            dimensions[product.id] = dimension
+        return dimensions
@@ -0,0 +1,269 @@
+# -*- coding: utf-8 -*-
+
+import json
+import logging
+import os
+
+from dateutil.relativedelta import relativedelta
+
+from odoo import models, fields, api, release
+from odoo.tools import config
+
+from ..tools.benchmark import measure
+
+_logger = logging.getLogger(__name__)
+
+# staff ids, product codes and order references of the generated records start with this
+BENCHMARK_PREFIX = "APLUS-BENCH"
+BENCHMARK_SIZES = (1000, 10000, 100000)
+BATCH_SIZE = 1000
+
+# maximum queries of every report entry point on warm caches, whatever the data
+# volume (see tests/test_query_budgets.py, which logs the actual counts below them)
+QUERY_BUDGETS = {
+    'client_stock_report': 40,
+    'warehouse_report': 40,
+    'inventory_held_report': 40,
+    'pfa_pension_report': 30,
+    'employee_paye_report': 30,
+    'payroll_schedule_report': 30,
+    'payment_schedule_report': 30,
+    'payroll_bundle_report': 40,
+    'action_warehouse_data': 40,
+    'action_payment_schedule_report': 30,
+}
+
+# (code, name, category code, amount as a share of the wage) of the benchmark payslip lines
+BENCHMARK_RULES = [
+    ('BASIC', 'Basic Salary', 'BASIC', 0.6),
+    ('HOUSING', 'Housing Allowance', 'ALW', 0.25),
+    ('TRANSPORT', 'Transport Allowance', 'ALW', 0.15),
+    ('GROSS', 'Gross', 'GROSS', 1.0),
+    ('EMP', 'Employee Pension', 'DED', 0.08),
+    ('EMYP', 'Employer Pension', 'COMP', 0.1),
+    ('PAY', 'PAYE', 'DED', 0.12),
+    ('NET', 'Net Salary', 'NET', 0.8),
+]
+
+
+class ReportBenchmark(models.AbstractModel):
+    """ Synthetic data generator and timings of every report entry point,
+    meant to be run from a shell on a throwaway database, e.g.::
+
+        env['aplus.report.diagnostics']._run_benchmark(sizes=(1000, 10000))
+        env.cr.commit()  # only to keep the generated data
+    """
+    _inherit = "aplus.report.diagnostics"
+
+    # BENCHMARK DATA
+    @api.model
+    def _populate_benchmark_data(self, size):
+        """ Top the benchmark data up to ``size`` employees (each with an open
+        contract and a done payslip of last month) and ``size`` confirmed sale
+        orders (three lines each, over size / 10 products and customers). """
+        self = self.with_context(tracking_disable=True, mail_create_nolog=True, mail_notrack=True)
+        self._populate_benchmark_payroll(size)
+        self._populate_benchmark_stock(size)
+        self.env.flush_all()
+
+    @api.model
+    def _get_benchmark_rule_categories(self):
+        categories = {}
+        for code in {category for __, __, category, __ in BENCHMARK_RULES}:
+            category = self.env['hr.salary.rule.category'].search([('code', '=', code)], limit=1)
+            categories[code] = category or self.env['hr.salary.rule.category'].create({'name': code, 'code': code})
+        return categories
+
+    @api.model
+    def _get_benchmark_structure(self):
+        structure = self.env['hr.payroll.structure'].search([('name', '=', BENCHMARK_PREFIX)], limit=1)
+        if structure:
+            return structure
+        structure_type = self.env['hr.payroll.structure.type'].create({'name': BENCHMARK_PREFIX})
+        structure = self.env['hr.payroll.structure'].create({'name': BENCHMARK_PREFIX, 'type_id': structure_type.id})
+        categories = self._get_benchmark_rule_categories()
+        self.env['hr.salary.rule'].create([{
+            'name': name,
+            'code': code,
+            'sequence': sequence,
+            'struct_id': structure.id,
+            'category_id': categories[category].id,
+        } for sequence, (code, name, category, __) in enumerate(BENCHMARK_RULES, start=1)])
+        return structure
+
+    @api.model
+    def _populate_benchmark_payroll(self, size):
+        Employee = self.env['hr.employee']
+        existing = Employee.search_count([('staff_id', '=like', f"{BENCHMARK_PREFIX}-%")])
+        if existing >= size:
+            return
+
+        structure = self._get_benchmark_structure()
+        rules = {rule.code: rule for rule in structure.rule_ids}
+        departments = self.env['hr.department'].search([('name', '=like', f"{BENCHMARK_PREFIX}%")])
+        if not departments:
+            departments = self.env['hr.department'].create([
+                {'name': f"{BENCHMARK_PREFIX} Department {index}"} for index in range(10)
+            ])
+        date_from = fields.Date.today().replace(day=1) - relativedelta(months=1)
+        date_to = date_from + relativedelta(months=1, days=-1)
+
+        for start in range(existing, size, BATCH_SIZE):
+            indexes = range(start, min(start + BATCH_SIZE, size))
+            employees = Employee.create([{
+                'name': f"Benchmark Employee {index:06d}",
+                'staff_id': f"{BENCHMARK_PREFIX}-{index:06d}",
+                'tax_payer_number': f"TIN{index:08d}",
+                'rsa_pin': f"PEN{index:012d}",
+                'pfa_name': f"PFA {index % 20}",
+                'department_id': departments[index % len(departments)].id,
+            } for index in indexes])
+            contracts = self.env['hr.contract'].create([{
+                'name': f"{employee.staff_id} Contract",
+                'employee_id': employee.id,
+                'wage': 100000 + (employee.id % 50) * 5000,
+                'date_start': date_from - relativedelta(years=1),
+                'state': 'open',
+                'employee_voluntary': employee.id % 3 * 1000,
+                'employer_voluntary': employee.id % 4 * 1000,
+            } for employee in employees])
+            payslips = self.env['hr.payslip'].create([{
+                'name': f"{contract.employee_id.staff_id} {date_from}",
+                'employee_id': contract.employee_id.id,
+                'contract_id': contract.id,
+                'struct_id': structure.id,
+                'date_from': date_from,
+                'date_to': date_to,
+                'line_ids': [(0, 0, {
+                    'name': name,
+                    'code': code,
+                    'sequence': sequence,
+                    'salary_rule_id': rules[code].id,
+                    'amount': round(contract.wage * share, 2),
+                    'quantity': 1,
+                    'rate': 100,
+                }) for sequence, (code, name, __, share) in enumerate(BENCHMARK_RULES, start=1)],
+            } for contract in contracts])
+            payslips.write({'state': 'done'})
+            _logger.info("Benchmark data: %d employees", indexes[-1] + 1)
+
+    @api.model
+    def _populate_benchmark_stock(self, size):
+        SaleOrder = self.env['sale.order']
+        existing = SaleOrder.search_count([('client_order_ref', '=like', f"{BENCHMARK_PREFIX}-%")])
+        if existing >= size:
+            return
+
+        product_count = max(size // 10, 10)
+        products = self.env['product.product'].search([('default_code', '=like', f"{BENCHMARK_PREFIX}-%")])
+        if len(products) < product_count:
+            categories = self.env['product.category'].search([('name', '=like', f"{BENCHMARK_PREFIX}%")])
+            if not categories:
+                categories = self.env['product.category'].create([
+                    {'name': f"{BENCHMARK_PREFIX} Category {index}"} for index in range(10)
+                ])
+            new_products = self.env['product.product'].create([{
+                'name': f"Benchmark Product {index:06d}",
+                'default_code': f"{BENCHMARK_PREFIX}-{index:06d}",
+                'type': 'consu',
+                'is_storable': True,
+                'categ_id': categories[index % len(categories)].id,
+                'description_sale': f"Benchmark product {index}",
+            } for index in range(len(products), product_count)])
+            stock_location = self.env['stock.warehouse'].search([('company_id', '=', self.env.company.id)], limit=1).lot_stock_id
+            for product in new_products:
+                self.env['stock.quant']._update_available_quantity(product, stock_location, 50 + product.id % 200)
+            products |= new_products
+
+        customers = self.env['res.partner'].search([('ref', '=like', f"{BENCHMARK_PREFIX}-%")])
+        if len(customers) < product_count:
+            customers |= self.env['res.partner'].create([{
+                'name': f"Benchmark Customer {index:06d}",
+                'ref': f"{BENCHMARK_PREFIX}-{index:06d}",
+            } for index in range(len(customers), product_count)])
+
+        for start in range(existing, size, BATCH_SIZE):
+            indexes = range(start, min(start + BATCH_SIZE, size))
+            orders = SaleOrder.create([{
+                'partner_id': customers[index % len(customers)].id,
+                'client_order_ref': f"{BENCHMARK_PREFIX}-{index:06d}",
+                'order_line': [(0, 0, {
+                    'product_id': products[(index * 3 + line) % len(products)].id,
+                    'product_uom_qty': 1 + (index + line) % 10,
+                }) for line in range(3)],
+            } for index in indexes])
+            orders.action_confirm()
+            _logger.info("Benchmark data: %d sale orders", indexes[-1] + 1)
+
+    # BENCHMARK RUN
+    @api.model
+    def _get_benchmark_entry_points(self):
+        """ Return the [(name, callable)] of the report entry points; every
+        callable returns the download action of the generated file. """
+        date_to = fields.Date.today()
+        date_from = date_to - relativedelta(months=2)
+
+        def wizard_download(report_type):
+            def download():
+                self.env['aplus.report.cache'].sudo().search([('report_type', '=', report_type)]).unlink()
+                wizard = self.env['stock.management.report.wizard'].create({
+                    'report_type': report_type,
+                    'start_date': date_from,
+                    'end_date': date_to,
+                })
+                return wizard.download()
+            return download
+
+        report_types = self.env['stock.management.report.wizard']._fields['report_type'].selection
+        entry_points = [(report_type, wizard_download(report_type)) for report_type, __ in report_types]
+        entry_points.append(('action_warehouse_data', self.env['stock.picking'].action_warehouse_data))
+        entry_points.append(('action_payment_schedule_report',
+                             lambda: self.env['hr.employee'].action_payment_schedule_report(date_from, date_to)))
+        return entry_points
+
+    @api.model
+    def _get_output_size(self, action):
+        attachment_id = int(action['url'].rsplit('/', 1)[-1])
+        return self.env['ir.attachment'].browse(attachment_id).file_size
+
+    @api.model
+    def _run_benchmark(self, sizes=BENCHMARK_SIZES):
+        """ Populate the benchmark data at every size, time every report entry
+        point on it and write the results as JSON in the aplus_report_benchmark
+        directory of the data directory, to be compared between versions.
+        Return the results. """
+        self._check_diagnostics_access()
+        results = []
+        for size in sorted(sizes):
+            self._populate_benchmark_data(size)
+            for name, entry_point in self._get_benchmark_entry_points():
+                # timed without memory tracing, which slows allocations down
+                self.env.invalidate_all()
+                with measure(self.env.cr) as metrics:
+                    action = entry_point()
+                    self.env.flush_all()
+                # then run again to trace the Python memory
+                self.env.invalidate_all()
+                with measure(self.env.cr, trace_memory=True) as memory_metrics:
+                    entry_point()
+                    self.env.flush_all()
+                result = dict(metrics, size=size, report=name, output_size=self._get_output_size(action),
+                              peak_memory_kb=memory_metrics['peak_memory_kb'])
+                _logger.info("Benchmark %(report)s at %(size)d: %(wall_time).3fs, %(queries)d queries, "
+                             "%(peak_memory_kb)d KB Python, %(peak_rss_kb)d KB RSS growth, "
+                             "%(output_size)d bytes", result)
+                results.append(result)
+
+        module = self.env['ir.module.module'].search([('name', '=', 'aplus')], limit=1)
+        output_dir = os.path.join(config['data_dir'], 'aplus_report_benchmark')
+        os.makedirs(output_dir, exist_ok=True)
+        output_path = os.path.join(output_dir, f"{self.env.cr.dbname}-{fields.Datetime.now():%Y%m%d-%H%M%S}.json")
+        with open(output_path, 'w') as output:
+            json.dump({
+                'module_version': module.latest_version,
+                'odoo_version': release.version,
+                'date': fields.Datetime.now().isoformat(),
+                'results': results,
+            }, output, indent=2)
+        _logger.info("Benchmark results written to %s", output_path)
+        return results
@@ -0,0 +1,142 @@
+# -*- coding: utf-8 -*-
+
+import hashlib
+import logging
+
+from odoo import models, fields, api
+
+_logger = logging.getLogger(__name__)
+
+PAYROLL_TABLES = ['hr_payslip', 'hr_employee', 'hr_contract', 'hr_department', 'hr_salary_rule', 'hr_salary_rule_category',
+                  'aplus_payroll_summary']
+STOCK_TABLES = ['sale_order', 'stock_picking', 'stock_move', 'stock_quant', 'product_product', 'product_template', 'product_category', 'res_partner']
+
+# tables whose changes make a cached report stale, per report type
+REPORT_DEPENDENCIES = {
+    'employee_paye_report': PAYROLL_TABLES,
+    'pfa_pension_report': PAYROLL_TABLES,
+    'payroll_schedule_report': PAYROLL_TABLES,
+    'client_stock_report': STOCK_TABLES,
+    'inventory_held_report': STOCK_TABLES,
+}
+
+DEFAULT_MAX_AGE_DAYS = 30
+DEFAULT_MAX_SIZE_MB = 500
+
+
+class ReportCache(models.Model):
+    """ Stored report files, keyed by report parameters and data version.
+
+    The cached files are only readable by administrators: every requester
+    gets its own copy of them, see ir.attachment._copy_report_output.
+    """
+    _name = "aplus.report.cache"
+    _description = "Report Result Cache"
+    _order = "last_used desc"
+
+    report_type = fields.Char("Report Type", required=True, readonly=True)
+    start_date = fields.Date("Start Date", readonly=True)
+    end_date = fields.Date("End Date", readonly=True)
+    company_id = fields.Many2one("res.company", "Company", required=True, readonly=True, ondelete="cascade")
+    companies = fields.Char("Companies", readonly=True, help="Ids of the companies selected when the report was built.")
+    use_ledger = fields.Boolean("Read from Ledger", readonly=True)
+    fingerprint = fields.Char("Data Fingerprint", required=True, readonly=True)
+    attachment_id = fields.Many2one("ir.attachment", "File", readonly=True, ondelete="cascade")
+    file_size = fields.Integer("File Size", related="attachment_id.file_size")
+    hit_count = fields.Integer("Hits", readonly=True)
+    last_used = fields.Datetime("Last Used", readonly=True, default=fields.Datetime.now)
+
+    @api.model
+    def _get_fingerprint(self, report_type):
+        """ Return a hash of the inserted, updated and deleted row counts of
+        every table the report reads, or False when the report type is not
+        cacheable.
+
+        The counts come from the table statistics, which are cheap to read
+        and only grow when a transaction writing to the table ends, however
+        long ago it started; the changes of the current transaction are added
+        to them. Other transactions are only seen once they have reported
+        their statistics (within a second or so of their end).
+        """
+        tables = REPORT_DEPENDENCIES.get(report_type)
+        if not tables:
+            return False
+        self.env.flush_all()
+        self.env.cr.execute("""
+            select table_name,
+                   pg_stat_get_tuples_inserted(table_name::regclass) + pg_stat_get_xact_tuples_inserted(table_name::regclass),
+                   pg_stat_get_tuples_updated(table_name::regclass) + pg_stat_get_xact_tuples_updated(table_name::regclass),
+                   pg_stat_get_tuples_deleted(table_name::regclass) + pg_stat_get_xact_tuples_deleted(table_name::regclass)
+            from unnest(%s) as table_name
+        """, (list(tables),))
+        return hashlib.sha1(repr(self.env.cr.fetchall()).encode()).hexdigest()
+
+    @api.model
+    def _get_companies_key(self):
+        return ",".join(map(str, sorted(self.env.companies.ids)))
+
+    @api.model
+    def _key_domain(self, report_type, start_date, end_date, use_ledger=False):
+        return [
+            ('report_type', '=', report_type),
+            ('start_date', '=', start_date),
+            ('end_date', '=', end_date),
+            ('company_id', '=', self.env.company.id),
+            ('companies', '=', self._get_companies_key()),
+            ('use_ledger', '=', use_ledger),
+        ]
+
+    @api.model
+    def _lookup(self, report_type, start_date, end_date, fingerprint, use_ledger=False):
+        """ Return a copy of the attachment of a fresh cached result, dropping
+        the entries of the same parameters built on older data. """
+        entries = self.sudo().search(self._key_domain(report_type, start_date, end_date, use_ledger))
+        fresh = entries.filtered(lambda entry: entry.fingerprint == fingerprint)[:1]
+        (entries - fresh).unlink()
+        if not fresh:
+            return self.env['ir.attachment']
+        fresh.write({'hit_count': fresh.hit_count + 1, 'last_used': fields.Datetime.now()})
+        return fresh.attachment_id.with_env(self.env)._copy_report_output()
+
+    @api.model
+    def _store(self, report_type, start_date, end_date, fingerprint, file_name, report_file, use_ledger=False):
+        """ Cache the report file and return a copy of it for the requester. """
+        entry = self.sudo().create({
+            'report_type': report_type,
+            'start_date': start_date,
+            'end_date': end_date,
+            'company_id': self.env.company.id,
+            'companies': self._get_companies_key(),
+            'use_ledger': use_ledger,
+            'fingerprint': fingerprint,
+        })
+        entry.attachment_id = self.env['ir.attachment'].sudo()._create_report_output(
+            file_name, report_file, record=entry,
+        )
+        return entry.attachment_id.with_env(self.env)._copy_report_output()
+
+    def unlink(self):
+        attachments = self.attachment_id
+        res = super().unlink()
+        attachments.unlink()
+        return res
+
+    @api.autovacuum
+    def _gc_report_cache(self):
+        """ Evict the entries unused for too long, then the least recently
+        used ones until the cache fits in its size limit. """
+        get_param = self.env['ir.config_parameter'].sudo().get_param
+        max_age = int(get_param('aplus.report_cache_max_age_days', DEFAULT_MAX_AGE_DAYS))
+        max_size = int(get_param('aplus.report_cache_max_size_mb', DEFAULT_MAX_SIZE_MB)) * 1024 * 1024
+
+        expired = self.sudo().search([('last_used', '<', fields.Datetime.subtract(fields.Datetime.now(), days=max_age))])
+        expired.unlink()
+
+        total_size = 0
+        to_evict = self.sudo()
+        for entry in self.sudo().search([], order="last_used desc"):
+            total_size += entry.file_size
+            if total_size > max_size:
+                to_evict |= entry
+        to_evict.unlink()
+        _logger.info("Report cache: %d expired and %d oversized entries evicted", len(expired), len(to_evict))
@@ -0,0 +1,133 @@
+# -*- coding: utf-8 -*-
+
+import logging
+
+from dateutil.relativedelta import relativedelta
+
+from odoo import models, fields, api
+from odoo.exceptions import AccessError, UserError
+
+from .payroll_summary import REFRESH_CONDITION, SUMMARY_STATES
+
+_logger = logging.getLogger(__name__)
+
+# tables the planner may scan sequentially below this (estimated) row count
+LARGE_TABLE_ROWS = 10000
+
+
+class ReportDiagnostics(models.AbstractModel):
+    """ Checks of the report queries, meant to be run from a shell on a
+    database populated with production-like data, e.g.::
+
+        env['aplus.report.diagnostics']._check_query_plans()
+    """
+    _name = "aplus.report.diagnostics"
+    _description = "Report Diagnostics"
+
+    @api.model
+    def _check_diagnostics_access(self):
+        if not (self.env.is_superuser() or self.env.user.has_group('base.group_system')):
+            raise AccessError("Only administrators can run the report diagnostics.")
+
+    @api.model
+    def _get_report_queries(self):
+        """ Return the [(label, query, params)] of the report queries, with
+        parameters taken from the current data. """
+        date_to = fields.Date.today()
+        date_from = date_to - relativedelta(months=1)
+        queries = []
+
+        summary = self.env['aplus.payroll.summary']
+        for name, (query, params) in summary._get_dataset_queries(date_from, date_to).items():
+            queries.append((f"payroll dataset {name} (period)", query, params))
+        payslip_run = self.env['hr.payslip.run'].search([], limit=1)
+        if payslip_run:
+            for name, (query, params) in summary._get_dataset_queries(payslip_run_id=payslip_run.id).items():
+                queries.append((f"payroll dataset {name} (batch)", query, params))
+        payslip = self.env['hr.payslip'].search([('state', 'in', SUMMARY_STATES)], limit=1)
+        if payslip:
+            keys = ((payslip.employee_id.id, payslip.date_from, payslip.date_to),)
+            queries.append(("payroll summary refresh", summary._insert_query(REFRESH_CONDITION), (keys,)))
+        columns = summary._get_schedule_columns(date_from, date_to)
+        queries.append(("payroll schedule pivot", *summary._get_schedule_query(columns, date_from, date_to)))
+
+        wizard = self.env['stock.management.report.wizard'].new({'start_date': date_from, 'end_date': date_to})
+        queries.append(("client stock demand", *wizard._get_client_stock_demand_query()))
+
+        queries.append(("warehouse owed quantities", self.env['stock.picking']._get_owed_quantities_query(), None))
+
+        ledger = self.env['aplus.client.stock.ledger']
+        queries.append(("client stock ledger rebuild", ledger._select_query('true'), None))
+        sale_order = self.env['sale.order'].search([('state', '=', 'sale')], limit=1)
+        if sale_order:
+            queries.append(("client stock ledger refresh", ledger._select_query('so.id in %s'), ((sale_order.id,),)))
+
+        snapshot = self.env['aplus.stock.snapshot']
+        queries.append(("stock balance (as of date)", *snapshot._get_balance_query(snapshot._get_as_of_datetime(date_from))))
+
+        warehouses = self.env['stock.warehouse'].search([])
+        products = self.env['product.product'].search([], limit=100)
+        template_ids = products.product_tmpl_id.ids
+        if products:
+            quant = self.env['stock.quant']
+            queries.append(("product on hand", *quant._get_product_on_hand_query(products.ids, warehouses)))
+            queries.append(("product on hand (as of date)",
+                            *quant._get_product_on_hand_query(products.ids, warehouses, date_from)))
+        if warehouses and template_ids:
+            params = (tuple(warehouses.lot_stock_id.ids), tuple(template_ids))
+            quant = self.env['stock.quant']
+            queries.append(("warehouse quantities", quant._get_template_warehouse_quantities_query(), params))
+            queries.append(("warehouse quantities (sub-locations)",
+                            quant._get_template_warehouse_quantities_query(include_children=True), params))
+            source, source_params = quant._get_quant_source(date_from)
+            queries.append(("warehouse quantities (as of date)",
+                            quant._get_template_warehouse_quantities_query(source=source), (*source_params, *params)))
+        return queries
+
+    @api.model
+    def _get_seq_scan_tables(self, query, params):
+        """ Return the tables the plan of ``query`` reads sequentially. """
+        self.env.cr.execute("explain (format json) " + query, params)
+        nodes = [self.env.cr.fetchone()[0][0]['Plan']]
+        tables = set()
+        while nodes:
+            node = nodes.pop()
+            if node['Node Type'] == 'Seq Scan':
+                tables.add(node['Relation Name'])
+            nodes.extend(node.get('Plans', []))
+        return tables
+
+    @api.model
+    def _check_query_plans(self, raise_if_failed=True, min_rows=LARGE_TABLE_ROWS):
+        """ EXPLAIN every report query and return the {label: tables} of the
+        queries scanning tables of at least ``min_rows`` rows sequentially,
+        raising when there are any (unless ``raise_if_failed`` is False).
+
+        With ``min_rows`` 0 every table counts, which on a small database only
+        makes sense once it is analyzed and sequential scans are disabled
+        (``set local enable_seqscan = off``): the planner then only scans
+        sequentially the tables that no index can serve.
+        """
+        self._check_diagnostics_access()
+        self.env.flush_all()
+        self.env.cr.execute("select relname, reltuples from pg_class where relkind in ('r', 'p')")
+        table_rows = dict(self.env.cr.fetchall())
+
+        failures = {}
+        for label, query, params in self._get_report_queries():
+            large_tables = {
+                table for table in self._get_seq_scan_tables(query, params)
+                # never analyzed tables have -1 rows
+                if max(table_rows.get(table, 0), 0) >= min_rows
+            }
+            if large_tables:
+                failures[label] = sorted(large_tables)
+                _logger.warning("Report query %r scans %s sequentially", label, ", ".join(sorted(large_tables)))
+            else:
+                _logger.info("Report query %r uses no sequential scan on large tables", label)
+
+        if failures and raise_if_failed:
+            raise UserError("Report queries scanning large tables sequentially:\n" + "\n".join(
+                f"- {label}: {', '.join(tables)}" for label, tables in failures.items()
+            ))
+        return failures
@@ -0,0 +1,84 @@
+# -*- coding: utf-8 -*-
+
+import json
+import logging
+from contextlib import contextmanager
+
+from odoo import models, fields, api
+
+from ..tools.profiler import profile_report
+
+_logger = logging.getLogger(__name__)
+
+DEFAULT_RETENTION_DAYS = 90
+
+
+class ReportExecutionLog(models.Model):
+    """ Phase timings and counters of one report run, see ReportProfiler. """
+    _name = "aplus.report.execution.log"
+    _description = "Report Execution Log"
+    _order = "id desc"
+
+    report = fields.Char("Report", required=True, readonly=True, index=True)
+    user_id = fields.Many2one("res.users", "User", readonly=True, index=True, ondelete="cascade")
+    company_id = fields.Many2one("res.company", "Company", readonly=True, ondelete="cascade")
+    state = fields.Selection([('done', 'Done'), ('failed', 'Failed')], readonly=True)
+    cache_hit = fields.Boolean("Served from Cache", readonly=True)
+    duration = fields.Float("Duration (s)", readonly=True, digits=(16, 3))
+    cache_time = fields.Float("Cache Lookup (s)", readonly=True, digits=(16, 3))
+    fetch_time = fields.Float("Fetching (s)", readonly=True, digits=(16, 3))
+    render_time = fields.Float("Rendering (s)", readonly=True, digits=(16, 3))
+    store_time = fields.Float("Storing (s)", readonly=True, digits=(16, 3))
+    queries = fields.Integer("Queries", readonly=True)
+    rows_fetched = fields.Integer("Rows Fetched", readonly=True)
+    cells_written = fields.Integer("Cells Written", readonly=True)
+    bytes_produced = fields.Integer("Bytes Produced", readonly=True)
+    error = fields.Char("Error", readonly=True)
+
+    @api.model
+    @contextmanager
+    def _profile(self, report):
+        """ Profile the report run inside the context and log it, also when
+        it fails. """
+        error = None
+        try:
+            with profile_report(self.env.cr) as profiler:
+                yield profiler
+        except Exception as e:
+            error = str(e) or type(e).__name__
+            raise
+        finally:
+            self._record(report, profiler, error)
+
+    @api.model
+    def _record(self, report, profiler, error=None):
+        vals = {
+            'report': report,
+            'user_id': self.env.uid,
+            'company_id': self.env.company.id,
+            'state': 'failed' if error else 'done',
+            'cache_hit': bool(profiler.counters.get('cache_hits')),
+            'duration': profiler.duration,
+            'cache_time': profiler.phase_time('cache'),
+            'fetch_time': profiler.phase_time('fetching'),
+            'render_time': profiler.phase_time('rendering'),
+            'store_time': profiler.phase_time('storing'),
+            'queries': profiler.queries,
+            'rows_fetched': profiler.counters.get('rows_fetched', 0),
+            'cells_written': profiler.counters.get('cells_written', 0),
+            'bytes_produced': profiler.counters.get('bytes_produced', 0),
+            'error': error,
+        }
+        _logger.info("report_execution %s", json.dumps(dict(vals, phases=profiler.phases), default=str))
+        if not error:
+            self.sudo().create(vals)
+            return
+        # the transaction of a failed report is rolled back, log it on its own
+        with self.env.registry.cursor() as cr:
+            self.env(cr=cr)[self._name].sudo().create(vals)
+
+    @api.autovacuum
+    def _gc_execution_logs(self):
+        days = int(self.env['ir.config_parameter'].sudo().get_param(
+            'aplus.report_execution_log_days', DEFAULT_RETENTION_DAYS))
+        self.sudo().search([('create_date', '<', fields.Datetime.subtract(fields.Datetime.now(), days=days))]).unlink()
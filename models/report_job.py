@@ -0,0 +1,207 @@
+# -*- coding: utf-8 -*-
+
+import logging
+
+from odoo import models, fields, api
+from odoo.exceptions import UserError
+
+from ..wizard.stock_management_report_wizard import PAYROLL_BUNDLE_REPORTS
+
+_logger = logging.getLogger(__name__)
+
+# minutes after which a job still running is considered lost with its worker
+DEFAULT_TIMEOUT_MINUTES = 60
+
+
+class ReportJobCancelled(Exception):
+    """ Raised inside a running job once its user cancelled it. """
+
+
+class ReportJob(models.Model):
+    _name = "aplus.report.job"
+    _description = "Background Report Job"
+    _order = "id desc"
+
+    name = fields.Char("Name", compute="_compute_name", store=True)
+    user_id = fields.Many2one("res.users", "Requested By", required=True, readonly=True,
+                              default=lambda self: self.env.user, ondelete="cascade")
+    company_id = fields.Many2one("res.company", "Company", required=True, readonly=True,
+                                 default=lambda self: self.env.company)
+    report_type = fields.Selection(selection="_get_report_types", required=True, readonly=True)
+    start_date = fields.Date("Start Date", readonly=True)
+    end_date = fields.Date("End Date", readonly=True)
+    payslip_run_id = fields.Many2one("hr.payslip.run", "Payslip Batch", readonly=True, ondelete="set null")
+    bundle_report_types = fields.Char("Bundled Reports", readonly=True)
+    warehouse_ids = fields.Many2many("stock.warehouse", string="Warehouses", readonly=True)
+    use_ledger = fields.Boolean("Read from Ledger", readonly=True)
+    as_of_date = fields.Date("As of Date", readonly=True)
+    state = fields.Selection(selection=[
+        ('queued', 'Queued'),
+        ('running', 'Running'),
+        ('done', 'Done'),
+        ('failed', 'Failed'),
+        ('cancelled', 'Cancelled'),
+    ], default='queued', required=True, readonly=True)
+    phase = fields.Char("Phase", readonly=True)
+    rows_processed = fields.Integer("Rows Processed", readonly=True)
+    date_started = fields.Datetime("Started On", readonly=True)
+    date_done = fields.Datetime("Finished On", readonly=True)
+    attachment_id = fields.Many2one("ir.attachment", "File", readonly=True, ondelete="set null")
+    error = fields.Text("Error", readonly=True)
+
+    @api.model
+    def _get_report_types(self):
+        return self.env["stock.management.report.wizard"]._fields["report_type"].selection
+
+    @api.depends('report_type', 'create_date')
+    def _compute_name(self):
+        report_types = dict(self._get_report_types())
+        for job in self:
+            job.name = f"{report_types.get(job.report_type, '')} ({fields.Date.to_date(job.create_date) or fields.Date.today()})"
+
+    def action_cancel(self):
+        for job in self:
+            if job.state not in ('queued', 'running'):
+                raise UserError("Only queued or running report jobs can be cancelled.")
+        self.write({'state': 'cancelled', 'phase': 'cancelled'})
+
+    def action_download(self):
+        self.ensure_one()
+        if not self.attachment_id:
+            raise UserError("The report file is not available.")
+        return self.attachment_id._get_report_download_action()
+
+    def _update_progress(self, phase, rows_processed=None):
+        """ Record the progress of a running job in its own transaction, so it
+        is visible while the report is generated, and stop the job if its user
+        cancelled it in the meantime. """
+        self.ensure_one()
+        with self.env.registry.cursor() as cr:
+            cr.execute("""
+                update aplus_report_job
+                set phase = %s, rows_processed = coalesce(%s, rows_processed)
+                where id = %s and state = 'running'
+                returning id
+            """, (phase, rows_processed, self.id))
+            running = cr.fetchone()
+        if not running:
+            raise ReportJobCancelled()
+
+    # ------------------------------------------------------------
+    # Runner
+    # ------------------------------------------------------------
+
+    @api.model
+    def _cron_process_jobs(self, limit=10):
+        self._fail_stale_jobs()
+        for _i in range(limit):
+            job_id = self._claim_next_job()
+            if not job_id:
+                break
+            self._process_job(job_id)
+
+    @api.model
+    def _fail_stale_jobs(self):
+        """ Fail the jobs running for longer than the timeout: their worker was
+        killed (time limit, out of memory) before it could record their end.
+        They are not queued again, as they would most likely kill the next
+        worker the same way. """
+        minutes = int(self.env['ir.config_parameter'].sudo().get_param(
+            'aplus.report_job_timeout_minutes', DEFAULT_TIMEOUT_MINUTES))
+        with self.env.registry.cursor() as cr:
+            cr.execute("""
+                update aplus_report_job
+                set state = 'failed', phase = 'failed', date_done = now() at time zone 'utc',
+                    error = 'The report was interrupted before it finished.'
+                where state = 'running' and date_started < now() at time zone 'utc' - make_interval(mins => %s)
+                returning id
+            """, (minutes,))
+            jobs = self.with_env(self.env(cr=cr)).browse([row[0] for row in cr.fetchall()])
+            for job in jobs:
+                _logger.warning("Report job %s timed out", job.id)
+                job._notify_user()
+
+    @api.model
+    def _claim_next_job(self):
+        with self.env.registry.cursor() as cr:
+            cr.execute("""
+                update aplus_report_job
+                set state = 'running', phase = 'starting', date_started = now() at time zone 'utc'
+                where id = (
+                    select id from aplus_report_job
+                    where state = 'queued'
+                    order by id
+                    limit 1
+                    for update skip locked
+                )
+                returning id
+            """)
+            row = cr.fetchone()
+        return row and row[0]
+
+    @api.model
+    def _process_job(self, job_id):
+        # The job row is only written from short separate transactions: the
+        # report transaction never locks it, so progress and cancellation
+        # stay possible while the report is generated.
+        try:
+            with self.env.registry.cursor() as cr:
+                job = self.with_env(self.env(cr=cr)).browse(job_id)
+                attachment_id = job._generate()
+        except ReportJobCancelled:
+            _logger.info("Report job %s cancelled", job_id)
+            return
+        except Exception as e:
+            _logger.exception("Report job %s failed", job_id)
+            with self.env.registry.cursor() as cr:
+                job = self.with_env(self.env(cr=cr)).browse(job_id)
+                job.write({'state': 'failed', 'phase': 'failed', 'error': str(e), 'date_done': fields.Datetime.now()})
+                job._notify_user()
+            return
+
+        with self.env.registry.cursor() as cr:
+            job = self.with_env(self.env(cr=cr)).browse(job_id)
+            if job.state != 'running':
+                # cancelled or timed out in the meantime: drop the file
+                job.env['ir.attachment'].sudo().browse(attachment_id).unlink()
+                return
+            job.write({
+                'state': 'done',
+                'phase': 'done',
+                'attachment_id': attachment_id,
+                'date_done': fields.Datetime.now(),
+            })
+            job._notify_user()
+
+    def _generate(self):
+        """ Generate the report as the requesting user and return the id of
+        the stored file. """
+        self.ensure_one()
+        wizard_env = self.with_user(self.user_id).with_company(self.company_id).with_context(report_job_id=self.id)
+        wizard = wizard_env.env["stock.management.report.wizard"].create({
+            'report_type': self.report_type,
+            'start_date': self.start_date,
+            'end_date': self.end_date,
+            'payslip_run_id': self.payslip_run_id.id,
+            'warehouse_ids': [(6, 0, self.warehouse_ids.ids)],
+            'use_ledger': self.use_ledger,
+            'as_of_date': self.as_of_date,
+            **self._get_bundle_values(),
+        })
+        return wizard._get_report_attachment().id
+
+    def _get_bundle_values(self):
+        if self.report_type != 'payroll_bundle_report':
+            return {}
+        report_types = (self.bundle_report_types or '').split(',')
+        return {field_name: report_type in report_types for report_type, field_name in PAYROLL_BUNDLE_REPORTS}
+
+    def _notify_user(self):
+        self.ensure_one()
+        if self.state == 'done':
+            notification = {'type': 'success', 'message': "The report is ready, download it from Report Jobs."}
+        else:
+            notification = {'type': 'danger', 'message': "The report could not be generated."}
+        self.env['bus.bus']._sendone(self.user_id.partner_id, 'simple_notification', dict(
+            notification, title=self.name, sticky=True,
+        ))
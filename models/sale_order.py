@@ -0,0 +1,15 @@
+# -*- coding: utf-8 -*-
+
+from odoo import models
+
+# sale order fields the client stock ledger depends on
+LEDGER_FIELDS = ('state', 'partner_id', 'company_id', 'date_order')
+
+
+class SaleOrder(models.Model):
+    _inherit = "sale.order"
+
+    def write(self, vals):
+        if any(field in vals for field in LEDGER_FIELDS):
+            self.env['aplus.client.stock.ledger']._mark_pending(self.ids)
+        return super().write(vals)
@@ -0,0 +1,62 @@
+# -*- coding: utf-8 -*-
+
+from odoo import models, fields, api
+from odoo.tools.sql import column_exists, create_column, create_index
+
+# move fields the client stock ledger depends on, date and priority through the
+# picking scheduled_date and priority they compute (recomputed without picking write)
+LEDGER_FIELDS = ('state', 'product_uom_qty', 'quantity', 'picked', 'picking_id', 'product_id', 'date', 'priority',
+                 'package_level_id', 'picking_type_id')
+
+
+class StockMove(models.Model):
+    _inherit = "stock.move"
+
+    owed_qty = fields.Float("Owed Quantity", compute="_compute_owed_qty", store=True,
+                            digits='Product Unit of Measure', help="Demand of the move not picked yet.")
+
+    def _auto_init(self):
+        # fill the new column with one query instead of recomputing every move
+        if not column_exists(self.env.cr, self._table, 'owed_qty'):
+            create_column(self.env.cr, self._table, 'owed_qty', 'numeric')
+            self.env.cr.execute("""
+                update stock_move
+                set owed_qty = case when state in ('done', 'cancel') then 0
+                    else greatest(product_uom_qty - case when picked then quantity else 0 end, 0) end
+            """)
+        return super()._auto_init()
+
+    def init(self):
+        # client stock reports: moves still owed of open deliveries
+        create_index(self.env.cr, 'stock_move_aplus_owed_idx', self._table,
+                     ['picking_id', 'product_id'], where="owed_qty > 0")
+
+    @api.depends('state', 'product_uom_qty', 'quantity', 'picked')
+    def _compute_owed_qty(self):
+        for move in self:
+            if move.state in ('done', 'cancel'):
+                move.owed_qty = 0
+            else:
+                move.owed_qty = max(move.product_uom_qty - (move.quantity if move.picked else 0), 0)
+
+    def _mark_ledger_pending(self):
+        self.env['aplus.client.stock.ledger']._mark_pending(self.picking_id.sale_id.ids)
+
+    @api.model_create_multi
+    def create(self, vals_list):
+        moves = super().create(vals_list)
+        moves._mark_ledger_pending()
+        return moves
+
+    def write(self, vals):
+        if not any(field in vals for field in LEDGER_FIELDS):
+            return super().write(vals)
+        # refresh both the sale orders the moves leave and the ones they join
+        self._mark_ledger_pending()
+        res = super().write(vals)
+        self._mark_ledger_pending()
+        return res
+
+    def unlink(self):
+        self._mark_ledger_pending()
+        return super().unlink()
@@ -0,0 +1,37 @@
+# -*- coding: utf-8 -*-
+
+from odoo import models, api
+from odoo.tools.sql import create_index
+
+# move line fields the quantity of their move, hence the client stock ledger, depends on
+LEDGER_FIELDS = ('quantity', 'picked', 'move_id')
+
+
+class StockMoveLine(models.Model):
+    _inherit = "stock.move.line"
+
+    def init(self):
+        # stock balances as of a date: done move lines between a snapshot and that date
+        create_index(self.env.cr, 'stock_move_line_aplus_done_date_idx', self._table,
+                     ['date'], where="state = 'done'")
+
+    def _mark_ledger_pending(self):
+        self.env['aplus.client.stock.ledger']._mark_pending(self.move_id.picking_id.sale_id.ids)
+
+    @api.model_create_multi
+    def create(self, vals_list):
+        lines = super().create(vals_list)
+        lines._mark_ledger_pending()
+        return lines
+
+    def write(self, vals):
+        if not any(field in vals for field in LEDGER_FIELDS):
+            return super().write(vals)
+        self._mark_ledger_pending()
+        res = super().write(vals)
+        self._mark_ledger_pending()
+        return res
+
+    def unlink(self):
+        self._mark_ledger_pending()
+        return super().unlink()
@@ -2,121 +2,124 @@
 
 from odoo import models,api,fields
 from odoo.exceptions import UserError
-import io
-import base64
-from openpyxl.utils import get_column_letter
-from openpyxl import Workbook
-from openpyxl.styles import Font, PatternFill, Alignment, Border, Side
+from odoo.tools.sql import create_index
+
+from ..tools.profiler import report_phase
+from ..tools.sql_stream import iter_query
+from ..tools.xlsx_writer import ColumnWidthTracker, XlsxStreamWriter
+
+# picking fields the client stock ledger depends on
+LEDGER_FIELDS = ('state', 'sale_id', 'priority', 'scheduled_date')
 
 
 class StockPicking(models.Model):
     _inherit = "stock.picking"
-    file_data = fields.Binary("File")
-    file_name = fields.Char("File Name")
+
+    def init(self):
+        # client stock demand: first open delivery of every sale order (distinct on sale_id)
+        create_index(self.env.cr, 'stock_picking_aplus_open_sale_idx', self._table,
+                     ['sale_id', 'priority desc', 'scheduled_date', 'id desc'], where="state != 'done'")
+
+    def write(self, vals):
+        if not any(field in vals for field in LEDGER_FIELDS):
+            return super().write(vals)
+        # refresh both the sale orders the pickings leave and the ones they join
+        self.env['aplus.client.stock.ledger']._mark_pending(self.sale_id.ids)
+        res = super().write(vals)
+        self.env['aplus.client.stock.ledger']._mark_pending(self.sale_id.ids)
+        return res
+
+    def unlink(self):
+        self.env['aplus.client.stock.ledger']._mark_pending(self.sale_id.ids)
+        return super().unlink()
 
     @api.model
-    def action_warehouse_data(self):
-        sale_orders = self.env["sale.order"].search([('state', '=', 'sale')])
-        pickings = self.env["stock.picking"].search([
-        ('sale_id', 'in', sale_orders.ids),
-        ('state', '!=', 'done'),
-        ])
-        product_data = {}
-        warehouse_list = self.env["stock.warehouse"].search([], order="sequence asc")
+    def action_warehouse_data(self, include_children=False):
+        with self.env["aplus.report.execution.log"]._profile("action_warehouse_data"):
+            file_name, report_file = self._render_warehouse_report(include_children)
+            with report_file:
+                attachment = self.env["ir.attachment"]._create_report_output(file_name, report_file)
+        return attachment._get_report_download_action()
 
-        for picking in pickings:
-            for move in picking.move_ids_without_package:
-                product = move.product_id.product_tmpl_id
-                if not product:
-                    continue
+    @api.model
+    def _render_warehouse_report(self, include_children=False, as_of_date=None):
+        report_phase("fetching")
+        warehouse_list = self.env["stock.warehouse"].search([], order="sequence asc")
+        owed_quantities = self._get_owed_quantities()
 
-                done_qty = sum(move.move_line_ids.mapped("qty_done"))
-                owed_qty = move.product_uom_qty - done_qty
+        product_data = {}
+        for product in self.env["product.template"].browse(list(owed_quantities)):
+            product_data[product.id] = {
+                "product": product,
+                "description": product.description_sale or "",
+                "product_name":product.name or "",
+                "product_category":product.categ_id.name or "",
+                "default_code": product.default_code or "",
+                "client_stock": owed_quantities[product.id],
+                "warehouses": {w.id: 0 for w in warehouse_list},
+            }
+
+        quantities = self.env["stock.quant"]._get_template_warehouse_quantities(
+            list(product_data), warehouse_list, include_children=include_children, as_of_date=as_of_date,
+        )
+        for pid, pdata in product_data.items():
+            pdata["warehouses"] = quantities[pid]
 
-                if owed_qty <= 0:
-                    continue
+        report_file = self._generate_custom_inventory_report(product_data, warehouse_list)
 
-                pid = product.id
-                if pid not in product_data:
-                    product_data[pid] = {
-                        "product": product,
-                        "description": product.description_sale or "",
-                        "product_name":product.name or "",
-                        "product_category":product.categ_id.name or "",
-                        "default_code": product.default_code or "",
-                        "client_stock": 0,
-                        "warehouses": {w.id: 0 for w in warehouse_list},
-                    }
+        file_name = f"Custom Inventory Report By Warehouse-{as_of_date or fields.Date.today()}.xlsx"
+        return file_name, report_file
 
-                product_data[pid]["client_stock"] += owed_qty
+    @api.model
+    def _get_owed_quantities_query(self):
+        """ Return the query of the owed quantity per product template over
+        the open deliveries of the confirmed sale orders, in the order the
+        products first appear in those deliveries (default picking order,
+        then move order). """
+        return """
+            with open_pickings as (
+                select sp.id, row_number() over (order by sp.priority desc, sp.scheduled_date asc, sp.id desc) as rank
+                from stock_picking as sp
+                join sale_order as so on so.id = sp.sale_id
+                where so.state = 'sale' and sp.state != 'done'
+            )
+            select pp.product_tmpl_id, sum(sm.owed_qty)
+            from open_pickings as op
+            join stock_move as sm on sm.picking_id = op.id
+            join product_product as pp on pp.id = sm.product_id
+            where sm.owed_qty > 0
+            group by pp.product_tmpl_id
+            order by min(array[op.rank, sm.sequence, sm.id])
+        """
 
-        for pid, pdata in product_data.items():
-            product = pdata["product"]
-            for wh in warehouse_list:
-                domain = [
-                    ('product_id.product_tmpl_id', '=', pid),
-                    ('location_id', '=', wh.lot_stock_id.id),
-                ]
-                quants = self.env["stock.quant"].search(domain)
-                qty = sum(quants.mapped('quantity'))
-                pdata["warehouses"][wh.id] = qty
-                    
-        file_data = self._generate_custom_inventory_report(product_data, warehouse_list)
-    
-        file_name = f"Custom Inventory Report By Warehouse-{fields.Date.today()}.xlsx"
-        file_data = base64.b64encode(file_data)
-
-        id = False
-        for data in pickings:
-            id = data.id
-            data.file_name = file_name
-            data.file_data = file_data
-        
-        return {
-            'type': 'ir.actions.act_url',
-            'url': f"/web/content/?model={self._name}&id={id}&field=file_data&filename={file_name}&download=true",
-            'target': 'self',
-        }
+    @api.model
+    def _get_owed_quantities(self):
+        """ Return {template_id: owed quantity}, see _get_owed_quantities_query. """
+        self.env.flush_all()
+        return dict(iter_query(self.env.cr, self._get_owed_quantities_query()))
 
     def _generate_custom_inventory_report(self, product_data, warehouse_list):
 
-        wb = Workbook()
-        ws = wb.active
-        ws.title = "Custom Inventory  Report By Warehouse"
+        writer = XlsxStreamWriter()
 
         # Styles
-        header_fill = PatternFill(start_color="FFFFFF", end_color="FFFFFF", fill_type="solid")
-        header_font = Font(color="000000", bold=True)
-        center = Alignment(horizontal="center")
-        left = Alignment(horizontal="left")
-        bold = Font(bold=True)
-        border = Border(left=Side(style="thin"),
-                        right=Side(style="thin"),
-                        top=Side(style="thin"),
-                        bottom=Side(style="thin"))
-    
+        writer.add_style('title', font_size=14, align='left', valign='vcenter')
+        writer.add_style('block_title', bold=True, font_size=14, align='center', valign='vcenter',
+                         border=5, border_color='#000000')
+        writer.add_style('header', pattern=1, bg_color='#FFFFFF', bold=True, font_color='#000000',
+                         align='center', border=1)
+        writer.add_style('cell', align='center', border=1)
+
+        writer.add_sheet("Custom Inventory  Report By Warehouse", autofit=ColumnWidthTracker(padding=3))
+
         total_columns = 3 + len(warehouse_list) + 2
 
-        ws.merge_cells(start_row=1, start_column=1, end_row=1, end_column=total_columns)
-        block_cell = ws.cell(row=1, column=1, value="Custom Inventory report by warehouse showing.")
-        block_cell.font = Font(bold=False, size=14)
-        block_cell.alignment = Alignment(horizontal="left", vertical="center")
-
-        ws.merge_cells(start_row=3, start_column=1, end_row=3, end_column=total_columns)
-        block_cell = ws.cell(row=3, column=1, value="STOCK BALANCE")
-        block_cell.font = Font(bold=True, size=14)
-        block_cell.alignment = Alignment(horizontal="center", vertical="center")
-
-        thick_black = Border(
-            left=Side(style="thick", color="000000"),
-            right=Side(style="thick", color="000000"),
-            top=Side(style="thick", color="000000"),
-            bottom=Side(style="thick", color="000000"),
-        )
+        writer.merge_row(0, total_columns - 1, "Custom Inventory report by warehouse showing.", 'title')
+        writer.skip_rows()
 
-        # Apply the thick border to each merged cell
-        for col in range(1, total_columns + 1):
-            ws.cell(row=3, column=col).border = thick_black
+        # the thick border is applied to each merged cell
+        writer.merge_row(0, total_columns - 1, "STOCK BALANCE", 'block_title')
+        writer.skip_rows()
 
         headers = [
             "Product Name",
@@ -131,20 +134,13 @@ class StockPicking(models.Model):
         headers += ["Client Stock", "Net Balance"]
 
         # Write headers in row 5
-        for col, title in enumerate(headers, start=1):
-            cell = ws.cell(row=5, column=col, value=title)
-            cell.fill = header_fill
-            cell.font = header_font
-            cell.alignment = center
-            cell.border = border
-
-        row = 6
+        writer.write_row(headers, 'header')
+
         for pid, pdata in product_data.items():
 
             # values in EXACT warehouse order
             warehouse_values = [pdata["warehouses"][w.id] for w in warehouse_list]
 
-            # delivery_orders = ",".join(sorted(list(pdata["delivery_order"])))
             total_wh = sum(warehouse_values)
             net_balance = total_wh - pdata["client_stock"]
 
@@ -169,31 +165,7 @@ class StockPicking(models.Model):
             ]
 
             # Write data row
-            for col, val in enumerate(row_data, start=1):
-                cell = ws.cell(row=row, column=col, value=val)
-                cell.border = border
-                cell.alignment = center
-
-            row += 1
-
-        for col in ws.columns:
-            max_length = 0
-            col_letter = get_column_letter(col[0].column)
-
-            for cell in col:
-                try:
-                    if cell.value:
-                        cell_length = len(str(cell.value))
-                        if cell_length > max_length:
-                            max_length = cell_length
-                except:
-                    pass
-
-            # Give padding of +3 for nicer spacing
-            adjusted_width = max_length + 3
-            ws.column_dimensions[col_letter].width = adjusted_width
+            writer.write_row(row_data, 'cell')
 
         # Return file
-        stream = io.BytesIO()
-        wb.save(stream)
-        return stream.getvalue()
\ No newline at end of file
+        return writer.close()
@@ -0,0 +1,101 @@
+# -*- coding: utf-8 -*-
+
+from odoo import models, api
+from odoo.tools.sql import create_index
+
+from ..tools.sql_stream import iter_query
+
+
+class StockQuant(models.Model):
+    _inherit = "stock.quant"
+
+    def init(self):
+        # warehouse quantities: quants of given locations, per product
+        create_index(self.env.cr, 'stock_quant_aplus_location_product_idx', self._table,
+                     ['location_id', 'product_id'])
+
+    @api.model
+    def _get_quant_source(self, as_of_date=None):
+        """ Return the (table expression, params) to read the quants from:
+        stock_quant, or the balances at the end of ``as_of_date``. """
+        if not as_of_date:
+            return "stock_quant", []
+        snapshot = self.env['aplus.stock.snapshot']
+        query, params = snapshot._get_balance_query(snapshot._get_as_of_datetime(as_of_date))
+        return f"({query})", params
+
+    @api.model
+    def _get_template_warehouse_quantities_query(self, include_children=False, source="stock_quant"):
+        """ Return the query summing the quants of the given product templates
+        (second parameter) per warehouse stock location (first parameter),
+        read from ``source`` (see _get_quant_source, its params come first). """
+        if include_children:
+            location_join = "quant_loc.parent_path like wh_loc.parent_path || '%%'"
+        else:
+            location_join = "quant_loc.id = wh_loc.id"
+
+        return f"""
+            select pp.product_tmpl_id as tmpl_id, wh_loc.id as location_id, sum(sq.quantity) as quantity
+            from {source} as sq
+            join product_product as pp on pp.id = sq.product_id
+            join stock_location as quant_loc on quant_loc.id = sq.location_id
+            join stock_location as wh_loc on {location_join}
+            where wh_loc.id in %s and pp.product_tmpl_id in %s
+            group by pp.product_tmpl_id, wh_loc.id
+        """
+
+    @api.model
+    def _get_template_warehouse_quantities(self, template_ids, warehouses, include_children=False, as_of_date=None):
+        """ Return {template_id: {warehouse_id: quantity}} for the stock location
+        of every warehouse, computed with a single grouped query.
+
+        With include_children the quants of all sub-locations of the warehouse
+        stock location (through parent_path) are rolled up as well. With
+        as_of_date the quantities are the ones at the end of that day.
+        """
+        matrix = {tmpl_id: {wh.id: 0 for wh in warehouses} for tmpl_id in template_ids}
+        if not template_ids or not warehouses:
+            return matrix
+
+        location_to_warehouse = {wh.lot_stock_id.id: wh.id for wh in warehouses}
+        source, params = self._get_quant_source(as_of_date)
+        query = self._get_template_warehouse_quantities_query(include_children, source)
+        self.env.flush_all()
+        rows = iter_query(self.env.cr, query, (*params, tuple(location_to_warehouse), tuple(template_ids)))
+        for tmpl_id, location_id, quantity in rows:
+            matrix[tmpl_id][location_to_warehouse[location_id]] = quantity
+        return matrix
+
+    @api.model
+    def _get_product_on_hand_query(self, product_ids, warehouses=None, as_of_date=None):
+        """ Return the (query, params) of _get_product_on_hand. """
+        source, params = self._get_quant_source(as_of_date)
+        conditions = ["sl.usage = 'internal'", "sq.product_id in %s", "sq.company_id in %s"]
+        params += [tuple(product_ids), tuple(self.env.companies.ids)]
+        if warehouses:
+            conditions.append("sl.warehouse_id in %s")
+            params.append(tuple(warehouses.ids))
+
+        query = f"""
+            select sq.product_id, sum(sq.quantity)
+            from {source} as sq
+            join stock_location as sl on sl.id = sq.location_id
+            where {' and '.join(conditions)}
+            group by sq.product_id
+        """
+        return query, params
+
+    @api.model
+    def _get_product_on_hand(self, product_ids, warehouses=None, as_of_date=None):
+        """ Return {product_id: quantity} on hand in the internal locations of
+        the current companies, restricted to the given warehouses if any, at
+        the end of as_of_date if any, computed with a single grouped query. """
+        on_hand = dict.fromkeys(product_ids, 0)
+        if not product_ids:
+            return on_hand
+
+        query, params = self._get_product_on_hand_query(product_ids, warehouses, as_of_date)
+        self.env.flush_all()
+        for product_id, quantity in iter_query(self.env.cr, query, params):
+            on_hand[product_id] = quantity
+        return on_hand
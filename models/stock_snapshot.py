@@ -0,0 +1,188 @@
+# -*- coding: utf-8 -*-
+
+import logging
+from datetime import datetime, time, timedelta
+
+import pytz
+
+from odoo import models, fields, api
+from odoo.exceptions import AccessError
+from odoo.tools.sql import create_index
+
+_logger = logging.getLogger(__name__)
+
+# days during which every snapshot is kept, only the last one of each month is kept after that
+DEFAULT_RETENTION_DAYS = 90
+
+
+class StockSnapshot(models.Model):
+    """ Quantities of every product per internal location at a point in time.
+
+    Taken every day by a cron. The balance at any other date is the nearest
+    snapshot (or the current quants) plus the done move lines in between,
+    see _get_balance_query, so the replay never covers more than the time
+    between two snapshots.
+    """
+    _name = "aplus.stock.snapshot"
+    _description = "Stock Snapshot"
+    _order = "date desc"
+
+    date = fields.Datetime("Date", required=True, readonly=True, index=True, default=fields.Datetime.now)
+    line_ids = fields.One2many("aplus.stock.snapshot.line", "snapshot_id", "Quantities", readonly=True)
+    line_count = fields.Integer("Lines", readonly=True)
+
+    @api.model
+    def _get_as_of_datetime(self, as_of_date):
+        """ Return the end of the day ``as_of_date`` in the timezone of the
+        user, as a naive UTC datetime. """
+        tz = pytz.timezone(self.env.context.get('tz') or self.env.user.tz or 'UTC')
+        end_of_day = tz.localize(datetime.combine(as_of_date + timedelta(days=1), time.min))
+        return end_of_day.astimezone(pytz.utc).replace(tzinfo=None)
+
+    @api.model
+    def _get_nearest_snapshot(self, at):
+        """ Return the (id, date) of the snapshot closest to ``at``, or
+        (None, now) when the current quants are closer. """
+        now = fields.Datetime.now()
+        self.env.cr.execute("""
+            select id, date from aplus_stock_snapshot
+            order by abs(extract(epoch from date - %s)) limit 1
+        """, (at,))
+        row = self.env.cr.fetchone()
+        if row and abs(row[1] - at) < abs(now - at):
+            return row
+        return None, now
+
+    @api.model
+    def _get_balance_query(self, at):
+        """ Return the (query, params) of the quantity per product, internal
+        location and company at the naive UTC datetime ``at``, with the
+        columns of stock_quant it needs (product_id, location_id,
+        company_id, quantity).
+
+        Moves done before a snapshot are part of it: the done move lines
+        dated between the nearest snapshot and ``at`` are added to it, or
+        taken out of it when the snapshot is later than ``at``.
+        """
+        snapshot_id, snapshot_date = self._get_nearest_snapshot(at)
+        if snapshot_id:
+            base = """
+                select product_id, location_id, company_id, quantity
+                from aplus_stock_snapshot_line where snapshot_id = %s
+            """
+            params = [snapshot_id]
+        else:
+            base = """
+                select sq.product_id, sq.location_id, sq.company_id, sq.quantity
+                from stock_quant as sq
+                join stock_location as sl on sl.id = sq.location_id
+                where sl.usage = 'internal'
+            """
+            params = []
+        sign = 1 if snapshot_date <= at else -1
+        window = [min(snapshot_date, at), max(snapshot_date, at)]
+
+        query = f"""
+            select product_id, location_id, company_id, sum(quantity) as quantity
+            from (
+                {base}
+                union all
+                select sml.product_id, sml.location_dest_id, sl.company_id, %s * sml.quantity_product_uom
+                from stock_move_line as sml
+                join stock_location as sl on sl.id = sml.location_dest_id
+                where sml.state = 'done' and sml.date >= %s and sml.date < %s and sl.usage = 'internal'
+                union all
+                select sml.product_id, sml.location_id, sl.company_id, %s * sml.quantity_product_uom
+                from stock_move_line as sml
+                join stock_location as sl on sl.id = sml.location_id
+                where sml.state = 'done' and sml.date >= %s and sml.date < %s and sl.usage = 'internal'
+            ) as balance
+            group by product_id, location_id, company_id
+        """
+        return query, params + [sign, *window, -sign, *window]
+
+    @api.model
+    def _take_snapshot(self, at=None):
+        """ Store the quantities on hand now, or at the naive UTC datetime
+        ``at`` (computed from the nearest snapshot). """
+        self.env.flush_all()
+        # the query is built before the snapshot exists, which would be the nearest one
+        if at:
+            query, params = self._get_balance_query(at)
+        else:
+            query = """
+                select sq.product_id, sq.location_id, sq.company_id, sum(sq.quantity) as quantity
+                from stock_quant as sq
+                join stock_location as sl on sl.id = sq.location_id
+                where sl.usage = 'internal'
+                group by sq.product_id, sq.location_id, sq.company_id
+            """
+            params = []
+        snapshot = self.sudo().create({'date': at or fields.Datetime.now()})
+        self.env.flush_all()
+        self.env.cr.execute(f"""
+            insert into aplus_stock_snapshot_line (snapshot_id, product_id, location_id, company_id, quantity)
+            select %s, product_id, location_id, company_id, quantity
+            from ({query}) as quantities
+            where quantity != 0
+        """, [snapshot.id, *params])
+        snapshot.line_count = self.env.cr.rowcount
+        _logger.info("Stock snapshot of %s: %d lines", snapshot.date, snapshot.line_count)
+        return snapshot
+
+    @api.model
+    def _cron_take_snapshot(self):
+        self._take_snapshot()
+
+    @api.model
+    def _backfill_month_ends(self, months=12):
+        """ Take a snapshot at the end of each of the last ``months`` months
+        missing one, latest first so each one is replayed from the previous. """
+        month_end = fields.Date.today().replace(day=1) - timedelta(days=1)
+        for __ in range(months):
+            at = self._get_as_of_datetime(month_end)
+            if not self.sudo().search_count([('date', '=', at)]):
+                self._take_snapshot(at)
+            month_end = month_end.replace(day=1) - timedelta(days=1)
+
+    def _check_snapshot_access(self):
+        if not self.env.user.has_group('stock.group_stock_manager'):
+            raise AccessError("Only inventory administrators can take stock snapshots.")
+
+    def action_take_snapshot(self):
+        self._check_snapshot_access()
+        self._take_snapshot()
+
+    def action_backfill_month_ends(self):
+        self._check_snapshot_access()
+        self._backfill_month_ends()
+
+    @api.autovacuum
+    def _gc_snapshots(self):
+        days = int(self.env['ir.config_parameter'].sudo().get_param(
+            'aplus.stock_snapshot_days', DEFAULT_RETENTION_DAYS))
+        self.env.cr.execute("""
+            select id from (
+                select id, row_number() over (partition by date_trunc('month', date) order by date desc) as rank
+                from aplus_stock_snapshot where date < %s
+            ) as snapshots
+            where rank > 1
+        """, (fields.Datetime.subtract(fields.Datetime.now(), days=days),))
+        self.sudo().browse([row[0] for row in self.env.cr.fetchall()]).unlink()
+
+
+class StockSnapshotLine(models.Model):
+    _name = "aplus.stock.snapshot.line"
+    _description = "Stock Snapshot Line"
+    _log_access = False
+
+    snapshot_id = fields.Many2one("aplus.stock.snapshot", "Snapshot", required=True, ondelete="cascade")
+    product_id = fields.Many2one("product.product", "Product", required=True, ondelete="cascade")
+    location_id = fields.Many2one("stock.location", "Location", required=True, ondelete="cascade")
+    company_id = fields.Many2one("res.company", "Company")
+    quantity = fields.Float("Quantity", digits='Product Unit of Measure')
+
+    def init(self):
+        # balances: lines of one snapshot, per location and product
+        create_index(self.env.cr, 'aplus_stock_snapshot_line_snapshot_location_idx', self._table,
+                     ['snapshot_id', 'location_id', 'product_id'])
@@ -0,0 +1,4 @@
+# -*- coding: utf-8 -*-
+
+from . import test_query_budgets
+from . import test_client_stock_ledger
@@ -0,0 +1,68 @@
+# -*- coding: utf-8 -*-
+
+from odoo.models import PREFETCH_MAX
+from odoo.tests import TransactionCase, tagged
+
+from ..models.report_benchmark import QUERY_BUDGETS
+from ..tools.benchmark import measure
+
+# benchmark data sizes: the large one exceeds the ORM prefetch batch size, so
+# a query run per record adds more than a thousand queries to a report
+SMALL_SIZE = 5
+LARGE_SIZE = PREFETCH_MAX + 100
+# queries a report may gain from the small to the large size: reports walking
+# through records fetch them a prefetch batch at a time, a few queries per
+# batch of the (up to 3 * LARGE_SIZE) sale order lines and moves
+MAX_GROWTH = 20
+
+
+@tagged('post_install', '-at_install')
+class TestQueryBudgets(TransactionCase):
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.diagnostics = cls.env['aplus.report.diagnostics']
+
+    def _warm_up(self):
+        """ Run every report entry point once, filling the ormcache and the
+        registry caches, so the measured runs all start from warm caches. """
+        self.diagnostics._populate_benchmark_data(SMALL_SIZE)
+        for __, entry_point in self.diagnostics._get_benchmark_entry_points():
+            entry_point()
+            self.env.flush_all()
+
+    def _count_queries(self, size):
+        """ Populate the benchmark data up to ``size`` and return the query
+        count of every report entry point, each checked against its budget. """
+        self.diagnostics._populate_benchmark_data(size)
+        counts = {}
+        for name, entry_point in self.diagnostics._get_benchmark_entry_points():
+            self.env.invalidate_all()
+            with self.subTest(entry_point=name, size=size), self.assertQueryCount(QUERY_BUDGETS[name]):
+                with measure(self.env.cr) as metrics:
+                    entry_point()
+                    self.env.flush_all()
+            counts[name] = metrics['queries']
+        return counts
+
+    def test_query_budgets(self):
+        self._warm_up()
+        small_counts = self._count_queries(SMALL_SIZE)
+        large_counts = self._count_queries(LARGE_SIZE)
+        for name, count in large_counts.items():
+            with self.subTest(entry_point=name):
+                self.assertLessEqual(count, small_counts[name] + MAX_GROWTH,
+                                     f"{name} runs {count} queries on {LARGE_SIZE} records and "
+                                     f"{small_counts[name]} on {SMALL_SIZE}: some query runs per record")
+
+    def test_query_plans(self):
+        self.diagnostics._populate_benchmark_data(LARGE_SIZE)
+        # the stock balance starts from a snapshot rather than from every quant
+        self.env['aplus.stock.snapshot']._take_snapshot()
+        # on tables this small the planner prefers sequential scans: with fresh
+        # statistics and sequential scans disabled, only the tables no index
+        # can serve are still scanned, whatever their size
+        self.env.cr.execute("analyze")
+        self.env.cr.execute("set local enable_seqscan = off")
+        self.diagnostics._check_query_plans(min_rows=0)
@@ -0,0 +1,45 @@
+# -*- coding: utf-8 -*-
+
+import resource
+import time
+import tracemalloc
+from contextlib import contextmanager
+
+
+@contextmanager
+def measure(cr, trace_memory=False):
+    """ Measure the block run inside the context; the yielded dict is filled
+    on exit with its query count, wall time (seconds) and the growth of the
+    peak resident memory of the process (KB, ru_maxrss: 0 when the block
+    stays below an earlier peak), which includes the memory of C extensions
+    and psycopg2 buffers.
+
+    With ``trace_memory``, the peak of the Python memory allocated by the
+    block is traced as well (KB, tracemalloc) under ``peak_memory_kb``;
+    tracing slows allocations down, so the wall time of such a run is not
+    representative and should be taken from a run without it.
+    """
+    metrics = {}
+    tracing = trace_memory and tracemalloc.is_tracing()
+    if trace_memory:
+        if not tracing:
+            tracemalloc.start()
+        tracemalloc.reset_peak()
+        memory_start = tracemalloc.get_traced_memory()[0]
+    rss_start = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    queries = cr.sql_log_count
+    start = time.perf_counter()
+    try:
+        yield metrics
+    finally:
+        wall_time = time.perf_counter() - start
+        metrics.update(
+            queries=cr.sql_log_count - queries,
+            wall_time=round(wall_time, 3),
+            peak_rss_kb=resource.getrusage(resource.RUSAGE_SELF).ru_maxrss - rss_start,
+        )
+        if trace_memory:
+            memory_peak = tracemalloc.get_traced_memory()[1]
+            if not tracing:
+                tracemalloc.stop()
+            metrics['peak_memory_kb'] = max(memory_peak - memory_start, 0) // 1024
@@ -0,0 +1,70 @@
+# -*- coding: utf-8 -*-
+
+from dataclasses import dataclass, field
+
+# salary rule categories listed as deductions in the payroll schedule
+DEDUCTION_CATEGORIES = ('DED', 'TAX')
+# salary rule codes left out of the payroll schedule columns
+SCHEDULE_EXCLUDED_CODES = ('LEAVE', 'EMYP')
+
+
+@dataclass
+class EmployeePayroll:
+    """ Done payslip amounts of one employee over a period. """
+    employee_id: int
+    staff_id: str = ''
+    name: str = ''
+    department: str = ''
+    tax_payer_number: str = ''
+    rsa_pin: str = ''
+    pfa_name: str = ''
+    bank_name: str = ''
+    acc_number: str = ''
+    wage: float = 0.0
+    employee_voluntary: float = 0.0
+    employer_voluntary: float = 0.0
+    rules: dict = field(default_factory=dict)  # {payslip line name: amount}
+    codes: dict = field(default_factory=dict)  # {salary rule code: amount}
+
+    @property
+    def gross(self):
+        return self.codes.get('GROSS', 0.0)
+
+    @property
+    def tax(self):
+        return self.codes.get('PAY', 0.0)
+
+    @property
+    def employee_pension(self):
+        return self.codes.get('EMP', 0.0)
+
+    @property
+    def employer_pension(self):
+        return self.codes.get('EMYP', 0.0)
+
+    @property
+    def net(self):
+        return self.codes.get('NET', 0.0)
+
+
+@dataclass
+class PayrollDataset:
+    """ Payslip facts of a period, shared by all the payroll reports. """
+    employees: dict = field(default_factory=dict)  # {employee_id: EmployeePayroll}, by employee name
+    rule_totals: dict = field(default_factory=dict)  # {payslip line name: amount}
+    rule_categories: dict = field(default_factory=dict)  # {(line name, rule code): category code}
+
+    def _columns(self, deduction):
+        return sorted({
+            name for (name, code), category in self.rule_categories.items()
+            if (code or '') not in SCHEDULE_EXCLUDED_CODES
+            and ((category or '') in DEDUCTION_CATEGORIES) == deduction
+        })
+
+    @property
+    def earning_columns(self):
+        return self._columns(deduction=False)
+
+    @property
+    def deduction_columns(self):
+        return self._columns(deduction=True)
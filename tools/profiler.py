@@ -0,0 +1,81 @@
+# -*- coding: utf-8 -*-
+
+import contextvars
+import time
+from contextlib import contextmanager
+
+_current_profiler = contextvars.ContextVar('aplus_report_profiler', default=None)
+
+
+class ReportProfiler:
+    """ Wall time and queries spent in every phase of one report run, plus
+    counters of the work done (rows fetched, cells written, bytes produced).
+
+    Phases follow each other: entering a phase ends the current one, and
+    entering a phase again adds to its previous figures.
+    """
+
+    def __init__(self, cr):
+        self.cr = cr
+        self.phases = {}  # {phase: {'time': seconds, 'queries': count}}
+        self.counters = {}
+        self.phase = None
+        self.duration = 0.0
+        self.queries = 0
+        self._start = self._phase_start = time.perf_counter()
+        self._start_queries = self._phase_queries = cr.sql_log_count
+
+    def _close_phase(self):
+        if self.phase is None:
+            return
+        stats = self.phases.setdefault(self.phase, {'time': 0.0, 'queries': 0})
+        stats['time'] += time.perf_counter() - self._phase_start
+        stats['queries'] += self.cr.sql_log_count - self._phase_queries
+        self.phase = None
+
+    def enter_phase(self, phase):
+        if phase == self.phase:
+            return
+        self._close_phase()
+        self.phase = phase
+        self._phase_start = time.perf_counter()
+        self._phase_queries = self.cr.sql_log_count
+
+    def count(self, counter, value=1):
+        self.counters[counter] = self.counters.get(counter, 0) + value
+
+    def stop(self):
+        self._close_phase()
+        self.duration = time.perf_counter() - self._start
+        self.queries = self.cr.sql_log_count - self._start_queries
+
+    def phase_time(self, phase):
+        return self.phases.get(phase, {}).get('time', 0.0)
+
+
+@contextmanager
+def profile_report(cr):
+    """ Profile the report run inside the context: report_phase() and
+    report_count() calls made meanwhile (in this context, see contextvars)
+    are recorded on the yielded ReportProfiler. """
+    profiler = ReportProfiler(cr)
+    token = _current_profiler.set(profiler)
+    try:
+        yield profiler
+    finally:
+        profiler.stop()
+        _current_profiler.reset(token)
+
+
+def report_phase(phase):
+    """ Enter ``phase`` in the report run being profiled, if any. """
+    profiler = _current_profiler.get()
+    if profiler is not None:
+        profiler.enter_phase(phase)
+
+
+def report_count(counter, value=1):
+    """ Add ``value`` to ``counter`` of the report run being profiled, if any. """
+    profiler = _current_profiler.get()
+    if profiler is not None:
+        profiler.count(counter, value)
@@ -0,0 +1,35 @@
+# -*- coding: utf-8 -*-
+
+import hashlib
+import tempfile
+
+# reports bigger than this are moved to disk while they are generated
+SPOOL_MAX_SIZE = 8 * 1024 * 1024
+CHUNK_SIZE = 64 * 1024
+
+
+def spooled_report_file():
+    """ Return the binary file a report is generated into: kept in memory
+    while small, moved to a temporary file on disk above SPOOL_MAX_SIZE. """
+    return tempfile.SpooledTemporaryFile(max_size=SPOOL_MAX_SIZE)
+
+
+def iter_chunks(file, chunk_size=CHUNK_SIZE):
+    """ Read ``file`` from its start, ``chunk_size`` bytes at a time. """
+    file.seek(0)
+    while True:
+        chunk = file.read(chunk_size)
+        if not chunk:
+            return
+        yield chunk
+
+
+def file_checksum(file):
+    """ Return the size and the sha1 checksum (as used by the filestore) of
+    ``file`` without loading it in memory. """
+    sha = hashlib.sha1()
+    size = 0
+    for chunk in iter_chunks(file):
+        sha.update(chunk)
+        size += len(chunk)
+    return size, sha.hexdigest()
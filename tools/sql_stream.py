@@ -0,0 +1,31 @@
+# -*- coding: utf-8 -*-
+
+import itertools
+
+from .profiler import report_count
+
+# rows fetched from the server at once
+FETCH_BATCH_SIZE = 2000
+
+_cursor_names = itertools.count()
+
+
+def iter_query(cr, query, params=None, batch_size=FETCH_BATCH_SIZE):
+    """ Yield the rows of ``query`` as tuples, fetched ``batch_size`` at a
+    time through a named (server-side) cursor of the transaction of ``cr``.
+
+    Only one batch of rows is held in memory at once, so the caller can
+    aggregate large results while they stream. The query goes straight to
+    psycopg2: pending ORM writes must be flushed by the caller.
+    """
+    with cr._cnx.cursor(name=f"aplus_stream_{next(_cursor_names)}") as server_cursor:
+        server_cursor.itersize = batch_size
+        server_cursor.execute(query, params)
+        # counted like the queries of the cursor itself (query budgets, benchmarks)
+        cr.sql_log_count += 1
+        while True:
+            rows = server_cursor.fetchmany(batch_size)
+            if not rows:
+                return
+            report_count('rows_fetched', len(rows))
+            yield from rows
@@ -0,0 +1,163 @@
+# -*- coding: utf-8 -*-
+
+import xlsxwriter
+
+from .profiler import report_count, report_phase
+from .report_file import spooled_report_file
+
+# Excel does not accept longer worksheet names
+MAX_SHEET_TITLE = 31
+# widest column Excel can display
+MAX_COLUMN_WIDTH = 255
+# number of rows between two progress notifications
+PROGRESS_STEP = 1000
+
+
+class ColumnWidthTracker:
+    """ Keep the longest display length per column while rows are written,
+    so columns can be sized once at the end without reading cells back.
+
+    :param padding: added to the longest length of every column
+    :param max_width: upper bound of a column width
+    :param sample_step: only measure one row out of ``sample_step``
+    :param sample_limit: stop measuring after that many rows
+    """
+
+    def __init__(self, padding=2, max_width=100, sample_step=1, sample_limit=None):
+        self.padding = padding
+        self.max_width = min(max_width or MAX_COLUMN_WIDTH, MAX_COLUMN_WIDTH)
+        self.sample_step = max(sample_step, 1)
+        self.sample_limit = sample_limit
+        self.lengths = {}
+        self._rows_seen = 0
+        self._rows_measured = 0
+
+    def _measure(self):
+        measure = self._rows_seen % self.sample_step == 0 and (
+            self.sample_limit is None or self._rows_measured < self.sample_limit
+        )
+        self._rows_seen += 1
+        if measure:
+            self._rows_measured += 1
+        return measure
+
+    @staticmethod
+    def display_length(value):
+        if not value:
+            return 0
+        if isinstance(value, str):
+            return max(len(line) for line in value.splitlines()) if '\n' in value else len(value)
+        return len(str(value))
+
+    def track_row(self, values, first_col=0):
+        """ Record the values of one row, starting at column ``first_col``. """
+        if not self._measure():
+            return
+        lengths = self.lengths
+        for col, value in enumerate(values, start=first_col):
+            length = self.display_length(value)
+            if length > lengths.get(col, 0):
+                lengths[col] = length
+
+    def widths(self):
+        """ Return ``{column_index: width}`` for every column up to the last
+        measured one. """
+        return {
+            col: min(self.lengths.get(col, 0) + self.padding, self.max_width)
+            for col in range(max(self.lengths, default=-1) + 1)
+        }
+
+
+class XlsxStreamWriter:
+    """ Row by row xlsx writer with constant memory usage.
+
+    Built on xlsxwriter's ``constant_memory`` mode: every row is flushed to a
+    temporary file as soon as the next one starts, so rows must be written
+    from top to bottom. Styles are registered once by name and shared by all
+    the cells using them.
+
+    The workbook is written into ``stream``, by default a spooled temporary
+    file. ``progress`` is an optional callable receiving
+    ``(phase, rows_processed)`` every PROGRESS_STEP rows.
+    """
+
+    def __init__(self, stream=None, progress=None):
+        report_phase('rendering')
+        self.stream = stream if stream is not None else spooled_report_file()
+        self.progress = progress
+        self.workbook = xlsxwriter.Workbook(self.stream, {
+            'constant_memory': True,
+            'strings_to_formulas': False,
+            'strings_to_urls': False,
+        })
+        self.styles = {}
+        self.sheet = None
+        self.row = 0
+        self.autofit = None
+        self.cells = 0
+
+    def add_style(self, name, **properties):
+        """ Register a named style, see xlsxwriter's Format properties. """
+        self.styles[name] = self.workbook.add_format(properties)
+
+    def add_sheet(self, title, widths=None, autofit=None):
+        """ Start a new worksheet; rows are then written from its first row.
+
+        :param widths: fixed column widths, ``{column_index: width}``
+        :param autofit: optional ColumnWidthTracker sizing the columns on the
+            written values once the sheet is finished
+        """
+        self._finish_sheet()
+        self.sheet = self.workbook.add_worksheet(title[:MAX_SHEET_TITLE])
+        self.row = 0
+        self.autofit = autofit
+        for col, width in (widths or {}).items():
+            self.sheet.set_column(col, col, width)
+
+    def _style(self, name):
+        return self.styles[name] if name else None
+
+    def write_row(self, values, style=None):
+        """ Write ``values`` on the current row and move to the next one.
+
+        ``style`` is either one style name for the whole row or a list with a
+        style name (or None) per value. A None value with a style is written as
+        a styled blank cell, a None value without style is skipped.
+        """
+        styles = style if isinstance(style, (list, tuple)) else [style] * len(values)
+        for col, (value, style_name) in enumerate(zip(values, styles)):
+            if value is None and not style_name:
+                continue
+            self.sheet.write(self.row, col, value, self._style(style_name))
+            self.cells += 1
+        if self.autofit:
+            self.autofit.track_row(values)
+        self.row += 1
+        if self.progress and self.row % PROGRESS_STEP == 0:
+            self.progress('rendering', self.row)
+
+    def merge_row(self, first_col, last_col, value, style=None):
+        """ Write ``value`` in cells merged over the given columns of the
+        current row and move to the next one. """
+        self.sheet.merge_range(self.row, first_col, self.row, last_col, value, self._style(style))
+        self.cells += 1
+        if self.autofit:
+            self.autofit.track_row([value], first_col=first_col)
+        self.row += 1
+
+    def skip_rows(self, count=1):
+        self.row += count
+
+    def _finish_sheet(self):
+        if self.sheet is None or self.autofit is None:
+            return
+        for col, width in self.autofit.widths().items():
+            self.sheet.set_column(col, col, width)
+
+    def close(self):
+        """ Finish the workbook and return its file, rewound. """
+        self._finish_sheet()
+        self.workbook.close()
+        report_count('cells_written', self.cells)
+        self.stream.seek(0)
+        return self.stream
@@ -1,11 +1,22 @@
 from odoo import models, fields
+from odoo.exceptions import UserError
 from datetime import date, timedelta
 import io
-import base64
 import csv
-from openpyxl import Workbook
-from openpyxl.styles import Font, PatternFill, Alignment, Border, Side
-from openpyxl.utils import get_column_letter
+import zipfile
+
+from ..tools.profiler import report_count, report_phase
+from ..tools.report_file import iter_chunks, spooled_report_file
+from ..tools.sql_stream import iter_query
+from ..tools.xlsx_writer import PROGRESS_STEP, ColumnWidthTracker, XlsxStreamWriter
+
+# payroll reports of the bundle, in archive order: (report type, wizard field selecting it)
+PAYROLL_BUNDLE_REPORTS = [
+    ('employee_paye_report', 'bundle_employee_paye'),
+    ('pfa_pension_report', 'bundle_pfa_pension'),
+    ('payroll_schedule_report', 'bundle_payroll_schedule'),
+    ('payment_schedule_report', 'bundle_payment_schedule'),
+]
 
 
 class StockManagement(models.TransientModel):
@@ -14,19 +25,67 @@ class StockManagement(models.TransientModel):
 
     start_date = fields.Date("Start Date",default=date.today() - timedelta(days=30))
     end_date = fields.Date("End Date", default=date.today())
-    file_data = fields.Binary("File")
-    file_name = fields.Char("File Name")
     report_type = fields.Selection(selection=[
         ('client_stock_report','Client Stock Report'),
+        ('warehouse_report','Custom Inventory Report By Warehouse'),
         ('inventory_held_report','Inventory Held Report'),
         ('pfa_pension_report','PFA Pension Report'),
         ('employee_paye_report','Employee Paye Report'),
-        ('payroll_schedule_report','Payroll Schedule Report')
+        ('payroll_schedule_report','Payroll Schedule Report'),
+        ('payment_schedule_report','Payment Schedule Report'),
+        ('payroll_bundle_report','All Payroll Reports')
     ])
+    payslip_run_id = fields.Many2one('hr.payslip.run', "Payslip Batch",
+        help="Pay the payslips of this batch instead of the ones of the period.")
+    warehouse_ids = fields.Many2many('stock.warehouse', string="Warehouses",
+        help="Only count the stock available in these warehouses (all of them when empty).")
+    as_of_date = fields.Date("As of Date",
+        help="Show the stock on hand at the end of this day instead of the current one.")
+    use_ledger = fields.Boolean("Read from Ledger",
+        help="Read the client demand from the client stock ledger instead of the open deliveries.")
+    bundle_employee_paye = fields.Boolean("Employee Paye Report", default=True)
+    bundle_pfa_pension = fields.Boolean("PFA Pension Report", default=True)
+    bundle_payroll_schedule = fields.Boolean("Payroll Schedule Report", default=True)
+    bundle_payment_schedule = fields.Boolean("Payment Schedule Report", default=True)
+    run_in_background = fields.Boolean("Run in Background",
+        help="Generate the report in a background job and get notified when the file is ready.")
 
     def download(self):
+        if self.run_in_background:
+            return self._enqueue_report_job()
+
+        return self._get_report_attachment()._get_report_download_action()
+
+    def _get_report_attachment(self):
+        """ Return the stored file of the selected report, served from the
+        result cache when the underlying data did not change. """
+        with self.env['aplus.report.execution.log']._profile(self.report_type):
+            report_phase('cache')
+            cache = self.env['aplus.report.cache']
+            # cached results are not keyed by warehouse nor by stock date
+            fingerprint = not self.warehouse_ids and not self.as_of_date and cache._get_fingerprint(self.report_type)
+            if fingerprint:
+                attachment = cache._lookup(self.report_type, self.start_date, self.end_date, fingerprint, self.use_ledger)
+                if attachment:
+                    report_count('cache_hits')
+                    return attachment
+
+            file_name, report_file = self._render_report()
+            self._report_progress('storing')
+            with report_file:
+                if fingerprint:
+                    return cache._store(self.report_type, self.start_date, self.end_date, fingerprint,
+                                        file_name, report_file, use_ledger=self.use_ledger)
+                return self.env['ir.attachment']._create_report_output(file_name, report_file)
+
+    def _render_report(self):
+        """ Generate the selected report and return its file name and its
+        (rewound) binary file. """
+        self._report_progress('fetching')
         if self.report_type == "client_stock_report":
            return self.client_stock_data()
+        elif self.report_type == "warehouse_report":
+            return self.env['stock.picking']._render_warehouse_report(as_of_date=self.as_of_date)
         elif self.report_type == "inventory_held_report":
             return self.inventory_held_data()
         elif self.report_type == "pfa_pension_report":
@@ -35,448 +94,243 @@ class StockManagement(models.TransientModel):
             return self.employee_paye_report()
         elif self.report_type == "payroll_schedule_report":
             return self._generate_payroll_schedule_report()
-
-    # GENERATE EMPLOYEE PAYE REPORT
-    def employee_paye_report(self):
-        if self.start_date and self.end_date:
-            query = """
-                select hr_pay.id as id, hr_emp.id as emp_id, hr_emp.staff_id as staff_id, hr_emp.name as emp_name, 
-                hr_emp.tax_payer_number as tax_payer_number, hr_sal_rul.code as code, hr_pay_line.amount as amount, hr_con.wage as wage
-                from hr_payslip as hr_pay 
-                left join hr_employee as hr_emp on hr_pay.employee_id = hr_emp.id
-                left join hr_payslip_line as hr_pay_line on hr_pay.id = hr_pay_line.slip_id
-                left join hr_salary_rule as hr_sal_rul on hr_pay_line.salary_rule_id = hr_sal_rul.id
-                left join hr_contract as hr_con on hr_emp.id = hr_con.employee_id and hr_con.state = 'open'
-                where hr_pay.state = 'done' and hr_pay.date_from >= %s and hr_pay.date_to <= %s
-            """
-            params = (self.start_date, self.end_date)
-        else:
-            query = """
-                select hr_pay.id as id, hr_emp.id as emp_id, hr_emp.staff_id as staff_id, hr_emp.name as emp_name, 
-                hr_emp.tax_payer_number as tax_payer_number, hr_sal_rul.code as code, hr_pay_line.amount as amount, hr_con.wage as wage
-                from hr_payslip as hr_pay 
-                left join hr_employee as hr_emp on hr_pay.employee_id = hr_emp.id
-                left join hr_payslip_line as hr_pay_line on hr_pay.id = hr_pay_line.slip_id
-                left join hr_salary_rule as hr_sal_rul on hr_pay_line.salary_rule_id = hr_sal_rul.id
-                left join hr_contract as hr_con on hr_emp.id = hr_con.employee_id and hr_con.state = 'open'
-                where hr_pay.state = 'done'
-            """
-            params = ()
-
-        self.env.cr.execute(query, params)
-        hr_payslips = self.env.cr.dictfetchall()
-
-        employee_dict = {}
-
-        for payslip in hr_payslips: 
-            emp_id = payslip['emp_id']
-            tax_payable = taxable_amount = 0
-            if payslip['code'] == "GROSS":
-                taxable_amount = payslip['amount']
-            if payslip['code'] == "PAY":
-                tax_payable = payslip['amount']
-
-            if emp_id not in employee_dict: #check the id for repetation
-                employee_dict[emp_id] = {
-                    "id": payslip['id'],
-                    "staff_id": payslip['staff_id'] or '',
-                    "name": payslip['emp_name'] or '',
-                    "tax_payer_number":payslip['tax_payer_number'] or '',
-                    "wage":payslip['wage']
-                }
-            employee_data = employee_dict[emp_id] # {id:value, staff_id: value}
-
-            employee_data["taxable_amount"] = employee_data.get("taxable_amount", 0) + taxable_amount # if taxable_amount += taxable_amount else taxable_amount
-            employee_data["tax_payable"] = employee_data.get("tax_payable", 0) + tax_payable # if tax_payable  += tax_payable else tax_payable
-
-        employees_data = list(employee_dict.values()) #[{id:value,etc...},etc..]
-
-        file_content = self._generate_employee_paye_report(employees_data)
-        
-        self.file_name = f"Employee PAYE Report-{fields.Date.today()}.xlsx"
-        self.file_data = base64.b64encode(file_content)
-        
+        elif self.report_type == "payment_schedule_report":
+            return self.env['hr.employee']._render_payment_schedule_report(
+                self.start_date, self.end_date, self.payslip_run_id.id,
+            )
+        elif self.report_type == "payroll_bundle_report":
+            return self.payroll_bundle_report()
+
+    def _report_progress(self, phase, rows_processed=None):
+        report_phase(phase)
+        # only reports generated by a background job record their progress
+        job_id = self.env.context.get('report_job_id')
+        if job_id:
+            self.env['aplus.report.job'].browse(job_id)._update_progress(phase, rows_processed)
+
+    def _enqueue_report_job(self):
+        job = self.env['aplus.report.job'].create({
+            'report_type': self.report_type,
+            'start_date': self.start_date,
+            'end_date': self.end_date,
+            'payslip_run_id': self.payslip_run_id.id,
+            'bundle_report_types': ','.join(self._get_bundle_report_types()),
+            'warehouse_ids': [(6, 0, self.warehouse_ids.ids)],
+            'use_ledger': self.use_ledger,
+            'as_of_date': self.as_of_date,
+        })
+        self.env.ref('aplus.ir_cron_process_report_jobs')._trigger()
         return {
-            'type': 'ir.actions.act_url',
-            'url': f"/web/content/?model={self._name}&id={self.id}&field=file_data&filename={self.file_name}&download=true",
-            'target': 'self',
+            'type': 'ir.actions.client',
+            'tag': 'display_notification',
+            'params': {
+                'type': 'info',
+                'title': job.name,
+                'message': "The report is being generated, you will be notified when it is ready.",
+                'next': {'type': 'ir.actions.act_window_close'},
+            },
         }
 
-    def _generate_employee_paye_report(self, employees):
-        wb = Workbook()
-        ws = wb.active
-        ws.title = "Employee Paye Report"
-
-        main_header_fill = PatternFill(start_color="FFFFFF", end_color="FFFFFF", fill_type="solid")
-        main_header_font = Font(bold=True, size=11, color="000000")
+    def _get_payroll_dataset(self):
+        return self.env['aplus.payroll.summary']._load_dataset(self.start_date, self.end_date)
 
-        center_alignment = Alignment(horizontal='center', vertical='center')
-        left_alignment = Alignment(horizontal='left', vertical='center')
-        right_alignment = Alignment(horizontal='right', vertical='center')
-
-        thin_border = Border(
-            left=Side(style='thin', color='000000'),
-            right=Side(style='thin', color='000000'),
-            top=Side(style='thin', color='000000'),
-            bottom=Side(style='thin', color='000000')
-        )
-
-        ws.column_dimensions['A'].width = 10
-        ws.column_dimensions['B'].width = 20
-        ws.column_dimensions['C'].width = 40
-        ws.column_dimensions['D'].width = 25
-        ws.column_dimensions['E'].width = 25
-        ws.column_dimensions['F'].width = 25
-        ws.column_dimensions['G'].width = 25
-
-        ws['A1'].value = "S/N"
-        ws['A1'].fill = main_header_fill
-        ws['A1'].font = main_header_font
-        ws['A1'].alignment = left_alignment
-        ws['A1'].border = thin_border
-
-        ws['B1'].value = "Staff ID"
-        ws['B1'].fill = main_header_fill
-        ws['B1'].font = main_header_font
-        ws['B1'].alignment = center_alignment
-        ws['B1'].border = thin_border
-
-        ws['C1'].value = "Name"
-        ws['C1'].fill = main_header_fill
-        ws['C1'].font = main_header_font
-        ws['C1'].alignment = left_alignment
-        ws['C1'].border = thin_border
-
-        ws['D1'].value = "Tax Payer Number"
-        ws['D1'].fill = main_header_fill
-        ws['D1'].font = main_header_font
-        ws['D1'].alignment = center_alignment
-        ws['D1'].border = thin_border
-
-        ws['E1'].value = "Staff Gross Pay"
-        ws['E1'].fill = main_header_fill
-        ws['E1'].font = main_header_font
-        ws['E1'].alignment = center_alignment
-        ws['E1'].border = thin_border
-
-        ws['F1'].value = "Taxable Amount"
-        ws['F1'].fill = main_header_fill
-        ws['F1'].font = main_header_font
-        ws['F1'].alignment = center_alignment
-        ws['F1'].border = thin_border
-
-        ws['G1'].value = "Tax Payable"
-        ws['G1'].fill = main_header_fill
-        ws['G1'].font = main_header_font
-        ws['G1'].alignment = center_alignment
-        ws['G1'].border = thin_border
-
-        cnt = 1
-        current_row = 2
-        for emp in employees:
-            cell_a = ws.cell(row=current_row, column=1)
-            cell_a.value = cnt
-            cell_a.alignment = right_alignment
-            cell_a.border = thin_border
-            
-            cell_b = ws.cell(row=current_row, column=2)
-            cell_b.value = emp["staff_id"]
-            cell_b.alignment = left_alignment
-            cell_b.border = thin_border
-            
-            cell_c = ws.cell(row=current_row, column=3)
-            cell_c.value = emp["name"]
-            cell_c.alignment = left_alignment
-            cell_c.border = thin_border
-            
-            cell_d = ws.cell(row=current_row, column=4)
-            cell_d.value = emp["tax_payer_number"]
-            cell_d.alignment = left_alignment
-            cell_d.border = thin_border
-            
-            cell_e = ws.cell(row=current_row, column=5)
-            cell_e.value = emp['wage'] or ''
-            cell_e.alignment = right_alignment
-            cell_e.border = thin_border
-            
-            cell_f = ws.cell(row=current_row, column=6)
-            cell_f.value = emp["taxable_amount"]
-            cell_f.alignment = right_alignment
-            cell_f.border = thin_border
-            
-            cell_g = ws.cell(row=current_row, column=7)
-            cell_g.value = emp["tax_payable"]
-            cell_g.alignment = right_alignment
-            cell_g.border = thin_border
-            
-            cnt += 1
-            current_row += 1
+    def _get_bundle_report_types(self):
+        if self.report_type != 'payroll_bundle_report':
+            return []
+        return [report_type for report_type, field_name in PAYROLL_BUNDLE_REPORTS if self[field_name]]
 
+    def _get_period_label(self):
+        if self.start_date and self.end_date:
+            return f"{self.start_date.strftime('%m/%y')} - {self.end_date.strftime('%m/%y')}"
+        return ""
+
+    # ALL PAYROLL REPORTS
+    def payroll_bundle_report(self):
+        """ Zip the selected payroll reports, rendered one after another from
+        one payroll dataset. """
+        report_types = self._get_bundle_report_types()
+        if not report_types:
+            raise UserError("Select at least one payroll report to export.")
+
+        dataset = self._get_payroll_dataset()
+        payment_dataset = dataset
+        if 'payment_schedule_report' in report_types:
+            if self.payslip_run_id:
+                payment_dataset = self.env['aplus.payroll.summary']._load_dataset(payslip_run_id=self.payslip_run_id.id)
+            elif not (self.start_date and self.end_date):
+                raise UserError("Select a payslip batch or a period for the Payment Schedule Report.")
+
+        today = fields.Date.today()
+        schedule_columns = dataset.earning_columns + dataset.deduction_columns
+        renderers = {
+            'employee_paye_report': (
+                f"Employee PAYE Report-{today}.xlsx",
+                lambda: self._generate_employee_paye_report(
+                    dataset.employees.values(), progress=self._report_progress),
+            ),
+            'pfa_pension_report': (
+                f"PFA Pension report-{today}.xlsx",
+                lambda: self._generate_pfa_pension_report(
+                    dataset.employees.values(), self._get_period_label(), progress=self._report_progress),
+            ),
+            'payroll_schedule_report': (
+                f"Payroll Schedule Report-{today}.csv",
+                lambda: self._write_payroll_schedule(
+                    schedule_columns, self._iter_dataset_schedule_rows(dataset, schedule_columns),
+                    progress=self._report_progress),
+            ),
+            'payment_schedule_report': (
+                f"Payment Schedule Report-{today}.xlsx",
+                lambda: self.env['hr.employee']._generate_payment_report(list(payment_dataset.employees.values())),
+            ),
+        }
 
-        excel_file = io.BytesIO()
-        wb.save(excel_file)
-        excel_file.seek(0)
-        file_content = excel_file.read()
-        excel_file.close()
-        return file_content
+        report_file = spooled_report_file()
+        try:
+            with zipfile.ZipFile(report_file, 'w', zipfile.ZIP_DEFLATED) as archive:
+                for report_type in report_types:
+                    file_name, render = renderers[report_type]
+                    with render() as rendered, archive.open(file_name, 'w') as target:
+                        for chunk in iter_chunks(rendered):
+                            target.write(chunk)
+        except Exception:
+            report_file.close()
+            raise
+        report_file.seek(0)
+
+        file_name = f"Payroll Reports-{today}.zip"
+        return file_name, report_file
 
-    #PFA PENSION REPORT
-    def pfa_pension_report(self):
-        if self.start_date and self.end_date:
-            query = """
-                select hr_pay.id as id, hr_emp.id as emp_id, hr_emp.staff_id as staff_id, hr_emp.name as emp_name, 
-                hr_emp.rsa_pin as rsa_pin,hr_emp.pfa_name as pfa_name, hr_sal_rul.code as code, hr_pay_line.amount as amount, hr_con.employee_voluntary as employee_voluntary,
-                hr_con.employer_voluntary as employer_voluntary from hr_payslip as hr_pay 
-                left join hr_employee as hr_emp on hr_pay.employee_id = hr_emp.id
-                left join hr_payslip_line as hr_pay_line on hr_pay.id = hr_pay_line.slip_id
-                left join hr_salary_rule as hr_sal_rul on hr_pay_line.salary_rule_id = hr_sal_rul.id
-                left join hr_contract as hr_con on hr_emp.id = hr_con.employee_id and hr_con.state = 'open'
-                where hr_pay.state = 'done' and hr_pay.date_from >= %s and hr_pay.date_to <= %s
-            """
-            params = (self.start_date, self.end_date)
-        else:
-            query = """
-                select hr_pay.id as id, hr_emp.id as emp_id, hr_emp.staff_id as staff_id, hr_emp.name as emp_name, 
-                hr_emp.rsa_pin as rsa_pin,hr_emp.pfa_name as pfa_name, hr_sal_rul.code as code, hr_pay_line.amount as amount, hr_con.employee_voluntary as employee_voluntary,
-                hr_con.employer_voluntary as employer_voluntary from hr_payslip as hr_pay 
-                left join hr_employee as hr_emp on hr_pay.employee_id = hr_emp.id
-                left join hr_payslip_line as hr_pay_line on hr_pay.id = hr_pay_line.slip_id
-                left join hr_salary_rule as hr_sal_rul on hr_pay_line.salary_rule_id = hr_sal_rul.id
-                left join hr_contract as hr_con on hr_emp.id = hr_con.employee_id and hr_con.state = 'open'
-                where hr_pay.state = 'done'
-            """
-            params = ()
-
-        self.env.cr.execute(query, params)
-        hr_payslips = self.env.cr.dictfetchall()
-
-        employee_dict = {}
-
-        for payslip in hr_payslips: 
-            emp_id = payslip['emp_id']
-
-            if emp_id not in employee_dict: #check the id for repetation
-                employee_dict[emp_id] = {
-                    "id": payslip['id'],
-                    "staff_id": payslip['staff_id'] or '',
-                    "name": payslip['emp_name'] or '',
-                    "rsa_pin": payslip['rsa_pin'] or '',
-                    "pfa_name": payslip['pfa_name'] or '',
-                    "employer_voluntary": payslip['employer_voluntary'] or '',
-                    "employee_voluntary": payslip['employee_voluntary'] or '',
-                    "employer_pension":0,
-                    "employee_pension":0
-                }
-            employee_data = employee_dict[emp_id] # {id:value, staff_id: value}
-
-            if payslip['code'] == "EMP":
-                employee_data["employee_pension"] += payslip['amount']
-
-            if payslip['code'] == 'EMYP':
-                employee_data["employer_pension"] += payslip['amount']
-
-        employees_data = list(employee_dict.values()) #[{id:value,etc...},etc..]    
-
-        file_content = self._generate_pfa_pension_report(employees_data)
-
-        self.file_name = f"PFA Pension report-{fields.Date.today()}.xlsx"
-        self.file_data = base64.b64encode(file_content)
+    # GENERATE EMPLOYEE PAYE REPORT
+    def employee_paye_report(self, dataset=None):
+        dataset = dataset or self._get_payroll_dataset()
+        report_file = self._generate_employee_paye_report(dataset.employees.values(), progress=self._report_progress)
         
-        return {
-            'type': 'ir.actions.act_url',
-            'url': f"/web/content/?model={self._name}&id={self.id}&field=file_data&filename={self.file_name}&download=true",
-            'target': 'self',
-        }
+        file_name = f"Employee PAYE Report-{fields.Date.today()}.xlsx"
+        return file_name, report_file
 
-    def _generate_pfa_pension_report(self,employees):
-        wb = Workbook()
-        ws = wb.active
-        ws.title = "PFA Pension Report"
+    def _generate_employee_paye_report(self, employees, progress=None):
+        writer = XlsxStreamWriter(progress=progress)
 
-        main_header_fill = PatternFill(start_color="FFFFFF", end_color="FFFFFF", fill_type="solid")
-        main_header_font = Font(bold=True, size=11, color="000000")
+        thin_border = {'border': 1, 'border_color': '#000000'}
+        header = dict(thin_border, pattern=1, bg_color='#FFFFFF', bold=True, font_size=11, font_color='#000000', valign='vcenter')
+        writer.add_style('header_left', align='left', **header)
+        writer.add_style('header_center', align='center', **header)
+        writer.add_style('left', align='left', valign='vcenter', **thin_border)
+        writer.add_style('right', align='right', valign='vcenter', **thin_border)
 
-        center_alignment = Alignment(horizontal='center', vertical='center')
-        left_alignment = Alignment(horizontal='left', vertical='center')
-        right_alignment = Alignment(horizontal='right', vertical='center')
+        writer.add_sheet("Employee Paye Report", widths={0: 10, 1: 20, 2: 40, 3: 25, 4: 25, 5: 25, 6: 25})
 
-        thin_border = Border(
-            left=Side(style='thin', color='000000'),
-            right=Side(style='thin', color='000000'),
-            top=Side(style='thin', color='000000'),
-            bottom=Side(style='thin', color='000000')
+        writer.write_row(
+            ["S/N", "Staff ID", "Name", "Tax Payer Number", "Staff Gross Pay", "Taxable Amount", "Tax Payable"],
+            ['header_left', 'header_center', 'header_left'] + ['header_center'] * 4,
         )
 
-        ws['A1'].value = "S/N"
-        ws['A1'].fill = main_header_fill
-        ws['A1'].font = main_header_font
-        ws['A1'].alignment = left_alignment
-        ws['A1'].border = thin_border
-
-        ws['B1'].value = "Staff ID"
-        ws['B1'].fill = main_header_fill
-        ws['B1'].font = main_header_font
-        ws['B1'].alignment = center_alignment
-        ws['B1'].border = thin_border
-
-        ws['C1'].value = "Employee Name"
-        ws['C1'].fill = main_header_fill
-        ws['C1'].font = main_header_font
-        ws['C1'].alignment = left_alignment
-        ws['C1'].border = thin_border
-
-        ws['D1'].value = "RSA Pin"
-        ws['D1'].fill = main_header_fill
-        ws['D1'].font = main_header_font
-        ws['D1'].alignment = center_alignment
-        ws['D1'].border = thin_border
-
-        ws['E1'].value = "PFA Code/Name"
-        ws['E1'].fill = main_header_fill
-        ws['E1'].font = main_header_font
-        ws['E1'].alignment = center_alignment
-        ws['E1'].border = thin_border
-
-        ws['F1'].value = "Employer Contribution"
-        ws['F1'].fill = main_header_fill
-        ws['F1'].font = main_header_font
-        ws['F1'].alignment = center_alignment
-        ws['F1'].border = thin_border
-
-        ws['G1'].value = "Employee Contribution"
-        ws['G1'].fill = main_header_fill
-        ws['G1'].font = main_header_font
-        ws['G1'].alignment = center_alignment
-        ws['G1'].border = thin_border
-
-        ws['H1'].value = "Employer Voluntary"
-        ws['H1'].fill = main_header_fill
-        ws['H1'].font = main_header_font
-        ws['H1'].alignment = center_alignment
-        ws['H1'].border = thin_border
-
-        ws['I1'].value = "Employee Voluntary"
-        ws['I1'].fill = main_header_fill
-        ws['I1'].font = main_header_font
-        ws['I1'].alignment = center_alignment
-        ws['I1'].border = thin_border
-
-        ws['J1'].value = "Total Contribution"
-        ws['J1'].fill = main_header_fill
-        ws['J1'].font = main_header_font
-        ws['J1'].alignment = center_alignment
-        ws['J1'].border = thin_border
-
-        ws['K1'].value = "Period"
-        ws['K1'].fill = main_header_fill
-        ws['K1'].font = main_header_font
-        ws['K1'].alignment = center_alignment
-        ws['K1'].border = thin_border
-
         cnt = 1
-        current_row = 2
+        row_styles = ['right', 'left', 'left', 'left', 'right', 'right', 'right']
         for emp in employees:
-            cell_a = ws.cell(row=current_row, column=1)
-            cell_a.value = cnt
-            cell_a.alignment = right_alignment
-            cell_a.border = thin_border
-            
-            cell_b = ws.cell(row=current_row, column=2)
-            cell_b.value = emp['staff_id'] or ''
-            cell_b.alignment = left_alignment
-            cell_b.border = thin_border
-            
-            cell_c = ws.cell(row=current_row, column=3)
-            cell_c.value = emp['name']
-            cell_c.alignment = left_alignment
-            cell_c.border = thin_border
-            
-            cell_d = ws.cell(row=current_row, column=4)
-            cell_d.value = emp['rsa_pin'] or ''
-            cell_d.alignment = left_alignment
-            cell_d.border = thin_border
-            
-            cell_e = ws.cell(row=current_row, column=5)
-            cell_e.value = emp['pfa_name'] or ''
-            cell_e.alignment = left_alignment
-            cell_e.border = thin_border
-
-            total_contribution = 0
-
-            cell_f = ws.cell(row=current_row, column=6)
-            cell_f.value = emp['employer_pension'] or ''
-            total_contribution += int(emp['employer_pension'])
-            cell_f.alignment = left_alignment
-            cell_f.border = thin_border
-
-            cell_g = ws.cell(row=current_row, column=7)
-            cell_g.value = emp['employee_pension'] or ''
-            total_contribution += int(emp['employee_pension'])
-            cell_g.alignment = left_alignment
-            cell_g.border = thin_border
-
-
-            cell_h = ws.cell(row=current_row, column=8)
-            cell_h.value = emp['employer_voluntary'] or ''
-            cell_h.alignment = left_alignment
-            cell_h.border = thin_border
-
-            cell_i = ws.cell(row=current_row, column=9)
-            cell_i.value = emp['employee_voluntary'] or ''
-            cell_i.alignment = left_alignment
-            cell_i.border = thin_border
+            writer.write_row([
+                cnt,
+                emp.staff_id,
+                emp.name,
+                emp.tax_payer_number,
+                emp.wage or '',
+                emp.gross,
+                emp.tax,
+            ], row_styles)
+            cnt += 1
 
-            employer_vol = emp.get('employer_voluntary') or 0
-            employee_vol = emp.get('employee_voluntary') or 0
-            total_contribution += int(employer_vol) + int(employee_vol)
+        return writer.close()
 
-            cell_j = ws.cell(row=current_row, column=10)
-            cell_j.value = total_contribution or ''
-            cell_j.alignment = left_alignment
-            cell_j.border = thin_border
+    #PFA PENSION REPORT
+    def pfa_pension_report(self, dataset=None):
+        dataset = dataset or self._get_payroll_dataset()
+        report_file = self._generate_pfa_pension_report(
+            dataset.employees.values(), self._get_period_label(), progress=self._report_progress,
+        )
 
-            period = f"{self.start_date.strftime('%m/%y')} - {self.end_date.strftime('%m/%y')}" if self.start_date and self.end_date else ""    
+        file_name = f"PFA Pension report-{fields.Date.today()}.xlsx"
+        return file_name, report_file
+
+    def _generate_pfa_pension_report(self, employees, period="", progress=None):
+        writer = XlsxStreamWriter(progress=progress)
+
+        thin_border = {'border': 1, 'border_color': '#000000'}
+        header = dict(thin_border, pattern=1, bg_color='#FFFFFF', bold=True, font_size=11, font_color='#000000', valign='vcenter')
+        writer.add_style('header_left', align='left', **header)
+        writer.add_style('header_center', align='center', **header)
+        writer.add_style('left', align='left', valign='vcenter', **thin_border)
+        writer.add_style('right', align='right', valign='vcenter', **thin_border)
+
+        writer.add_sheet("PFA Pension Report", autofit=ColumnWidthTracker(padding=2))
+
+        writer.write_row([
+            "S/N",
+            "Staff ID",
+            "Employee Name",
+            "RSA Pin",
+            "PFA Code/Name",
+            "Employer Contribution",
+            "Employee Contribution",
+            "Employer Voluntary",
+            "Employee Voluntary",
+            "Total Contribution",
+            "Period",
+        ], ['header_left', 'header_center', 'header_left'] + ['header_center'] * 8)
 
-            cell_k = ws.cell(row=current_row, column=11)
-            cell_k.value = period or ''
-            cell_k.alignment = left_alignment
-            cell_k.border = thin_border
+        cnt = 1
+        row_styles = ['right'] + ['left'] * 10
+        for emp in employees:
+            total_contribution = (int(emp.employer_pension) + int(emp.employee_pension)
+                                  + int(emp.employer_voluntary) + int(emp.employee_voluntary))
 
+            writer.write_row([
+                cnt,
+                emp.staff_id,
+                emp.name,
+                emp.rsa_pin,
+                emp.pfa_name,
+                emp.employer_pension or '',
+                emp.employee_pension or '',
+                emp.employer_voluntary or '',
+                emp.employee_voluntary or '',
+                total_contribution or '',
+                period or '',
+            ], row_styles)
             cnt += 1
-            current_row += 1
-            
 
-        for col in ws.columns:
-            max_length = 0
-            col_letter = get_column_letter(col[0].column)
+        return writer.close()
 
-            for cell in col:
-                try:
-                    if cell.value:
-                        cell_length = len(str(cell.value))
-                        if cell_length > max_length:
-                            max_length = cell_length
-                except:
-                    pass
 
-            adjusted_width = max_length + 2
-            ws.column_dimensions[col_letter].width = adjusted_width
+    #INVENTORY  HELD REPORT
+    def inventory_held_data(self):
+        if self.use_ledger:
+            product_ids_demand, customers_dict = self.env['aplus.client.stock.ledger']._get_inventory_held_demand(
+                self.start_date, self.end_date)
+        else:
+            product_ids_demand, customers_dict = self._get_inventory_held_demand()
+        product_ids_available = {product_id: {"available": 0} for product_id in product_ids_demand}
 
-        excel_file = io.BytesIO()
-        wb.save(excel_file)
-        excel_file.seek(0)
-        file_content = excel_file.read()
-        excel_file.close()
-        return file_content
+        #  Compute qty_available from stock, for all the products at once
+        on_hand = self.env['stock.quant']._get_product_on_hand(list(product_ids_demand), self.warehouse_ids, self.as_of_date)
+        for product_id, quantity in on_hand.items():
+            product_ids_available[product_id]['available'] = int(quantity)
 
+        #  Generate Excel
+        report_file = self._generate_inventory_held_report(
+            product_ids_demand,
+            product_ids_available,
+            customers_dict
+        )
 
-    #INVENTORY  HELD REPORT
-    def inventory_held_data(self):
+        file_name = f"Custom Report that shows inventory held for a client(Client Stock)-{self.as_of_date or fields.Date.today()}.xlsx"
+        return file_name, report_file
+
+    def _get_inventory_held_demand(self):
         domain = [('state', '=', 'assigned'),('sale_id.state', '=', 'sale'),('sale_id.date_order','>=',self.start_date),('sale_id.date_order','<=',self.end_date)] if self.start_date and self.end_date else [('state', '=', 'assigned'),('sale_id.state', '=', 'sale')]
         deliveries = self.env['stock.picking'].search(domain)
 
         product_ids_demand = {}     # {product_id: {'demand': qty}}
-        product_ids_available = {}  # {product_id: {'available': qty}}
         customers_dict = {}         # {product_id: {customer: count}}
 
         for delivery in deliveries:
@@ -496,7 +350,6 @@ class StockManagement(models.TransientModel):
                 #  Initialize dict for each product
                 if product_id not in product_ids_demand:
                     product_ids_demand[product_id] = {"demand": 0}
-                    product_ids_available[product_id] = {"available": 0}
                     customers_dict[product_id] = {}
 
                 #  Add booked qty
@@ -506,48 +359,23 @@ class StockManagement(models.TransientModel):
                 customers_dict[product_id].setdefault(customer, 0)
                 customers_dict[product_id][customer] += 1
 
-        #  Compute qty_available from stock
-        product_model = self.env['product.product']
-        for product_id in product_ids_demand.keys():
-            product = product_model.browse(product_id)
-            product_ids_available[product_id]['available'] = int(product.qty_available)
-
-        #  Generate Excel
-        file_content = self._generate_inventory_held_report(
-            product_ids_demand,
-            product_ids_available,
-            customers_dict
-        )
-
-        self.file_name = f"Custom Report that shows inventory held for a client(Client Stock)-{fields.Date.today()}.xlsx"
-        self.file_data = base64.b64encode(file_content)
-        
-        return {
-            'type': 'ir.actions.act_url',
-            'url': f"/web/content/?model={self._name}&id={self.id}&field=file_data&filename={self.file_name}&download=true",
-            'target': 'self',
-        }
+        return product_ids_demand, customers_dict
 
     def _generate_inventory_held_report(self, product_ids_demand, product_ids_available, customers_dict):
 
-        wb = Workbook()
-        ws = wb.active
-        ws.title = "Inventory Held For A Client Report"
+        writer = XlsxStreamWriter(progress=self._report_progress)
 
         # ---------- Styles ----------
-        bold = Font(bold=True)
-        center = Alignment(horizontal="center", vertical="center")
-        left = Alignment(horizontal="left", vertical="center")
-        border = Border(
-            left=Side(style='thin'), right=Side(style='thin'),
-            top=Side(style='thin'), bottom=Side(style='thin')
-        )
+        writer.add_style('title', bold=True, font_size=12, align='center', valign='vcenter')
+        writer.add_style('header', bold=True, align='center', valign='vcenter', border=1)
+        writer.add_style('cell', align='center', valign='vcenter', border=1)
+        writer.add_style('cell_red', align='center', valign='vcenter', border=1, font_color='#FF0000')
+
+        writer.add_sheet("Inventory Held For A Client Report", autofit=ColumnWidthTracker(padding=2))
 
         # ---------- Main Title ----------
-        ws.merge_cells('A1:G1')
-        ws['A1'].value = "Custom Report that shows inventory held for a client (Client Stock)"
-        ws['A1'].font = Font(bold=True, size=12)
-        ws['A1'].alignment = center
+        writer.merge_row(0, 6, "Custom Report that shows inventory held for a client (Client Stock)", 'title')
+        writer.skip_rows()
 
         # ---------- Header Row ----------
         headers = [
@@ -559,37 +387,24 @@ class StockManagement(models.TransientModel):
             "Net Balance",
             "Client's Name"
         ]
-
-        col = 1
-        for h in headers:
-            cell = ws.cell(row=3, column=col, value=h)
-            cell.font = bold
-            cell.alignment = center
-            cell.border = border
-            col += 1
+        writer.write_row(headers, 'header')
 
         # ---------- Prepare Product Lines ----------
-        product_obj = self.env["product.product"]
-
-        row = 4
+        dimensions = self.env["product.product"]._get_report_dimensions(list(product_ids_demand))
 
         for product_id in product_ids_demand.keys():
 
-            product = product_obj.browse(product_id)
+            product = dimensions[product_id]
             
-            category = product.categ_id.name or ''
-            description = product.description_sale or ""
+            category = product.category
+            description = product.description
             qty_available = int(product_ids_available[product_id]['available'])
             booked_qty = int(product_ids_demand[product_id]['demand'])
             net_balance = qty_available - booked_qty
             display_name = f"[{product.default_code}] - {product.name}" if product.default_code else product.name
 
             # Prepare client list
-            customers = []
-            for cust in customers_dict.get(product_id, {}).keys():
-                customers.append(cust)
-
-            customers_txt = "/".join(customers)
+            customers_txt = "/".join(customers_dict.get(product_id, {}).keys())
 
             # ---------- Write row ----------
             data = [
@@ -602,208 +417,121 @@ class StockManagement(models.TransientModel):
                 customers_txt
             ]
 
-            for i, value in enumerate(data, 1):
-                cell = ws.cell(row=row, column=i, value=value)
-                cell.border = border
-                cell.alignment = center if i <= 2 else center
-
-                # Red for negative or booked > 0
-                if i == 4 and booked_qty > 0:
-                    cell.font = Font(color="FF0000")
-                if i == 5 and net_balance < 0:
-                    cell.font = Font(color="FF0000")
-
-            row += 1
-
-        for col in ws.columns:
-            max_length = 0
-            col_letter = get_column_letter(col[0].column)
+            # Red for negative or booked > 0
+            styles = ['cell'] * len(data)
+            if booked_qty > 0:
+                styles[3] = 'cell_red'
+            if net_balance < 0:
+                styles[4] = 'cell_red'
 
-            for cell in col:
-                try:
-                    if cell.value:
-                        cell_length = len(str(cell.value))
-                        if cell_length > max_length:
-                            max_length = cell_length
-                except:
-                    pass
-
-            # Give padding of +2 for nicer spacing
-            adjusted_width = max_length + 2
-            ws.column_dimensions[col_letter].width = adjusted_width
+            writer.write_row(data, styles)
 
         # ---------- Generate File ----------
-        file_buf = io.BytesIO()
-        wb.save(file_buf)
-        file_buf.seek(0)
-        return file_buf.read()
+        return writer.close()
 
     #CLIENT STOCK REPORT
-    def client_stock_data(self):        
-        sale_order = self.env['sale.order'].search([('state', '=', 'sale')])
-        stock_picking = self.env['stock.picking']
-        product_product = self.env['product.product']
+    def client_stock_data(self):
+        if self.use_ledger:
+            product_ids_demand, customers_dict, sale_order_dict = self.env['aplus.client.stock.ledger']._get_client_stock_demand(
+                self.start_date, self.end_date)
+        else:
+            product_ids_demand, customers_dict, sale_order_dict = self._get_client_stock_demand()
 
-        product_ids_demand = dict() # {product_id: {demand:value}}
         product_ids_available = dict() # {product_id: {available:value}}
-        deliveries = []
-        sale_order_dict = dict()
-        customers_dict = dict()  # {product_id: {customer_name: count}}
-
-        for record in sale_order:
-            record_date = record.date_order.date()
-            if self.start_date and self.end_date:
-                if record_date >= self.start_date and record_date <= self.end_date:
-                    delivery = stock_picking.search([('origin', '=', record.name), ('state', '!=', 'done')], limit=1)
-                if delivery:
-                    deliveries.append(delivery)
-            else:
-                delivery = stock_picking.search([('origin', '=', record.name), ('state', '!=', 'done')], limit=1)
-                if delivery:
-                    deliveries.append(delivery)
+        on_hand = self.env['stock.quant']._get_product_on_hand(list(product_ids_demand), self.warehouse_ids, self.as_of_date)
+        for product_id, quantity in on_hand.items():
+            product_ids_available[product_id] = {'available': int(quantity)}
 
-        for delivery in deliveries:
-            customer_name = delivery.sale_id.partner_id.name
-            sale_order = delivery.sale_id.name
-            for move in delivery.move_ids:
-                product_id = move.product_id.id
-                if product_id in product_ids_demand:
-                    product_ids_demand[product_id]['demand'] += move.product_uom_qty
-                else:
-                    product_ids_demand[product_id] = {'demand': move.product_uom_qty}
-                    product_ids_available[product_id] = {'available': 0}
-                    customers_dict[product_id] = {}
-                    sale_order_dict[product_id] = set()
-                
-                if customer_name in customers_dict[product_id]:
-                    customers_dict[product_id][customer_name] += 1
-                else:
-                    customers_dict[product_id][customer_name] = 1
+        report_file = self._generate_client_stock_report(product_ids_demand, product_ids_available, customers_dict, sale_order_dict)
 
-                sale_order_dict[product_id].add(sale_order)
+        file_name = f"Client_Stock_Report_{self.as_of_date or fields.Date.today()}.xlsx"
+        return file_name, report_file
 
-        for product_id in product_ids_available.keys():
-            product = product_product.browse(product_id)
-            product_ids_available[product_id]['available'] = int(product.qty_available)
+    def _get_client_stock_demand_query(self):
+        """ Return the (query, params) of the owed quantity per sale order,
+        customer and product of the first open delivery of every confirmed
+        sale order, ordered like the sale orders. """
+        conditions = ["so.state = 'sale'", "sp.state != 'done'"]
+        params = []
+        if self.start_date and self.end_date:
+            conditions.append("so.date_order >= %s and so.date_order < %s")
+            params += [self.start_date, self.end_date + timedelta(days=1)]
+
+        query = f"""
+            with deliveries as (
+                select distinct on (sp.sale_id) sp.id, sp.sale_id
+                from stock_picking as sp
+                join sale_order as so on so.id = sp.sale_id
+                where {' and '.join(conditions)}
+                order by sp.sale_id, sp.priority desc, sp.scheduled_date asc, sp.id desc
+            )
+            select sm.product_id, so.name, rp.name, sum(sm.product_uom_qty), count(sm.id)
+            from deliveries
+            join sale_order as so on so.id = deliveries.sale_id
+            join res_partner as rp on rp.id = so.partner_id
+            join stock_move as sm on sm.picking_id = deliveries.id
+            group by so.id, so.name, so.date_order, rp.name, sm.product_id
+            order by so.date_order desc, so.id desc, min(sm.id)
+        """
+        return query, params
+
+    def _get_client_stock_demand(self):
+        """ Aggregate the owed quantity, customers and sale orders per product.
+
+        Only the first open delivery (in the default picking order) of every
+        confirmed sale order is taken into account. Rows come back ordered like
+        the sale orders themselves so customers keep their first-seen order.
+        """
+        query, params = self._get_client_stock_demand_query()
+        self.env.flush_all()
 
-        file_content = self._generate_client_stock_report(product_ids_demand, product_ids_available, customers_dict, sale_order_dict)
+        product_ids_demand = dict() # {product_id: {demand:value}}
+        customers_dict = dict()  # {product_id: {customer_name: count}}
+        sale_order_dict = dict() # {product_id: {sale_order: None}} (ordered set)
 
-        self.file_data = base64.b64encode(file_content)
+        for product_id, sale_order, customer_name, demand, move_count in iter_query(self.env.cr, query, params):
+            if product_id not in product_ids_demand:
+                product_ids_demand[product_id] = {'demand': 0}
+                customers_dict[product_id] = {}
+                sale_order_dict[product_id] = {}
 
-        self.file_name = f"Client_Stock_Report_{fields.Date.today()}.xlsx"
+            product_ids_demand[product_id]['demand'] += demand
+            customers = customers_dict[product_id]
+            customers[customer_name] = customers.get(customer_name, 0) + move_count
+            sale_order_dict[product_id][sale_order] = None
 
-        return {
-            'type': 'ir.actions.act_url',
-            'url': f"/web/content/?model={self._name}&id={self.id}&field=file_data&filename={self.file_name}&download=true",
-            'target': 'self',
-        }
+        return product_ids_demand, customers_dict, sale_order_dict
 
     def _generate_client_stock_report(self, product_ids_demand, product_ids_available, customers_dict, sale_order_dict):
-        wb = Workbook()
-        ws = wb.active
-        ws.title = "Client Stock Report"
-
-        main_header_fill = PatternFill(start_color="FFFFFF", end_color="FFFFFF", fill_type="solid")
-        main_header_font = Font(bold=True, size=11, color="4169E1")
-        
-        column_header_fill = PatternFill(start_color="FFFFFF", end_color="FFFFFF", fill_type="solid")
-        column_header_font = Font(bold=True, size=10)
-        
-        sub_header_fill = PatternFill(start_color="FFFF00", end_color="FFFF00", fill_type="solid")
-        sub_header_font = Font(bold=True, size=10, color="4169E1")
-        
-        category_fill = PatternFill(start_color="6699FF", end_color="6699FF", fill_type="solid")
-        category_font = Font(bold=True, color="FF0000", size=10)
-        
-        center_alignment = Alignment(horizontal='center', vertical='center')
-        left_alignment = Alignment(horizontal='left', vertical='center')
-        
-        thin_border = Border(
-            left=Side(style='thin', color='000000'),
-            right=Side(style='thin', color='000000'),
-            top=Side(style='thin', color='000000'),
-            bottom=Side(style='thin', color='000000')
-        )
-
-        ws.column_dimensions['A'].width = 40
-        ws.column_dimensions['B'].width = 25
-        ws.column_dimensions['C'].width = 12
-        ws.column_dimensions['D'].width = 12
-        ws.column_dimensions['E'].width = 12
-        ws.column_dimensions['F'].width = 60
-        ws.column_dimensions['G'].width = 60
-
-        main_header = ws['A1']
-        main_header.value = "CLIENTS' STOCK LIST"
-        main_header.fill = main_header_fill
-        main_header.font = main_header_font
-        main_header.alignment = center_alignment
-        main_header.border = thin_border
-
-        ws['A2'].value = "Product Name"
-        ws['A2'].fill = column_header_fill
-        ws['A2'].font = column_header_font
-        ws['A2'].alignment = center_alignment
-        ws['A2'].border = thin_border
-        
-        ws['B2'].value = ""
-        ws['B2'].fill = column_header_fill
-        ws['B2'].border = thin_border
-        
-        ws['C2'].value = "Quantity"
-        ws['C2'].fill = column_header_fill
-        ws['C2'].font = column_header_font
-        ws['C2'].alignment = center_alignment
-        ws['C2'].border = thin_border
-        
-        ws['F2'].value = "Client's Name"
-        ws['F2'].fill = column_header_fill
-        ws['F2'].font = column_header_font
-        ws['F2'].alignment = center_alignment
-        ws['F2'].border = thin_border
-
-        ws['A3'].value = ""
-        ws['A3'].border = thin_border
-        ws['B3'].value = ""
-        ws['B3'].border = thin_border
-        
-        ws['C3'].value = "Owed"
-        ws['C3'].fill = sub_header_fill
-        ws['C3'].font = sub_header_font
-        ws['C3'].alignment = center_alignment
-        ws['C3'].border = thin_border
-        
-        ws['D3'].value = "Avail"
-        ws['D3'].fill = sub_header_fill
-        ws['D3'].font = sub_header_font
-        ws['D3'].alignment = center_alignment
-        ws['D3'].border = thin_border
-        
-        ws['E3'].value = "Net Balance"
-        ws['E3'].fill = sub_header_fill
-        ws['E3'].font = sub_header_font
-        ws['E3'].alignment = center_alignment
-        ws['E3'].border = thin_border
-        
-        ws['F3'].value = ""
-        ws['F3'].border = thin_border
-        
-        ws['G2'].value = "Sale Order"
-        ws['G2'].fill = column_header_fill
-        ws['G2'].font = column_header_font
-        ws['G2'].alignment = center_alignment
-        ws['G2'].border = thin_border
+        writer = XlsxStreamWriter(progress=self._report_progress)
+
+        thin_border = {'border': 1, 'border_color': '#000000'}
+        white_fill = {'pattern': 1, 'bg_color': '#FFFFFF'}
+        writer.add_style('main_header', bold=True, font_size=11, font_color='#4169E1', align='center', valign='vcenter', **white_fill, **thin_border)
+        writer.add_style('total', bold=True, font_size=10, font_color='#000000', align='center', valign='vcenter', **white_fill, **thin_border)
+        writer.add_style('column_header', bold=True, font_size=10, align='center', valign='vcenter', **white_fill, **thin_border)
+        writer.add_style('sub_header', bold=True, font_size=10, font_color='#4169E1', align='center', valign='vcenter',
+                         pattern=1, bg_color='#FFFF00', **thin_border)
+        writer.add_style('category', bold=True, font_size=10, font_color='#FF0000', align='left', valign='vcenter',
+                         pattern=1, bg_color='#6699FF', **thin_border)
+        writer.add_style('border', **thin_border)
+        writer.add_style('left', align='left', valign='vcenter', **thin_border)
+        writer.add_style('left_red', align='left', valign='vcenter', font_color='#FF0000', **thin_border)
+        writer.add_style('center', align='center', valign='vcenter', **thin_border)
+        writer.add_style('center_red', align='center', valign='vcenter', font_color='#FF0000', **thin_border)
+
+        writer.add_sheet("Client Stock Report", widths={0: 40, 1: 25, 2: 12, 3: 12, 4: 12, 5: 60, 6: 60})
 
         total_owed = 0
         total_available = 0
         total_net_balance = 0
 
-        product_obj = self.env['product.product']
+        dimensions = self.env['product.product']._get_report_dimensions(list(product_ids_demand))
         products_by_category = {}
         
         for product_id in product_ids_demand.keys():
-            product = product_obj.browse(product_id)
-            category = product.categ_id.name if product.categ_id else 'Uncategorized'
+            product = dimensions[product_id]
+            category = product.category or 'Uncategorized'
             
             if category not in products_by_category:
                 products_by_category[category] = []
@@ -817,223 +545,110 @@ class StockManagement(models.TransientModel):
 
             display_name = f"[{product.default_code}] - {product.name}" if product.default_code else product.name
 
+            demand = int(product_ids_demand[product_id]['demand'])
+            available = int(product_ids_available[product_id]['available'])
+
+            # totals are shown on the first row, so they are summed before writing
+            total_owed += demand
+            total_available += available
+            total_net_balance += available - demand
+
             products_by_category[category].append({
-                'product': product,
-                'default_code': product.default_code or "",
+                'default_code': product.default_code,
                 'name': display_name,
-                'product_id': product_id,
-                'demand': product_ids_demand[product_id]['demand'],
-                'available': product_ids_available[product_id]['available'],
+                'demand': demand,
+                'available': available,
                 'sale_order': ','.join(sale_order_dict.get(product_id,[])),
                 'customers': ', '.join(customer_list)
             })
 
-        
-        current_row = 4
-        
+        writer.write_row(
+            ["CLIENTS' STOCK LIST", None, total_owed, total_available, total_net_balance],
+            ['main_header', None, 'total', 'total', 'main_header'],
+        )
+        writer.write_row(
+            ["Product Name", None, "Quantity", None, None, "Client's Name", "Sale Order"],
+            ['column_header', 'column_header', 'column_header', None, None, 'column_header', 'column_header'],
+        )
+        writer.write_row(
+            [None, None, "Owed", "Avail", "Net Balance", None],
+            ['border', 'border', 'sub_header', 'sub_header', 'sub_header', 'border'],
+        )
+
         for category in sorted(products_by_category.keys()):
-            ws.merge_cells(f'A{current_row}:G{current_row}')
-            category_cell = ws[f'A{current_row}']
-            category_cell.value = category.upper()
-            category_cell.fill = category_fill
-            category_cell.font = category_font
-            category_cell.alignment = left_alignment
-            category_cell.border = thin_border
-            current_row += 1
+            writer.merge_row(0, 6, category.upper(), 'category')
 
             for item in sorted(products_by_category[category], key=lambda x: x['default_code']):
-                demand = int(item['demand'])
-                available = int(item['available'])
+                demand = item['demand']
+                available = item['available']
                 net_balance = available - demand  # Net Balance = Available - Demand
 
-                total_owed += demand
-                total_available += available
-                total_net_balance += net_balance
-    
-                cell_a = ws.cell(row=current_row, column=1)
-                cell_a.value = item['name']
-                cell_a.alignment = left_alignment
-                cell_a.border = thin_border
-                
-                cell_c = ws.cell(row=current_row, column=3)
-                cell_c.value = demand
-                cell_c.alignment = left_alignment
-                cell_c.border = thin_border
-
-                if demand > 0:
-                    cell_c.font = Font(color="FF0000")
-                
-                cell_d = ws.cell(row=current_row, column=4)
-                cell_d.value = available
-                cell_d.alignment = center_alignment
-                cell_d.border = thin_border
-                
-                cell_e = ws.cell(row=current_row, column=5)
-                cell_e.value = net_balance
-                cell_e.alignment = center_alignment
-                cell_e.border = thin_border
-
-                if net_balance < 0:
-                    cell_e.font = Font(color="FF0000")
-                
-                cell_f = ws.cell(row=current_row, column=6)
-                cell_f.value = item['customers']
-                cell_f.alignment = center_alignment
-                cell_f.border = thin_border
-
-                cell_g = ws.cell(row=current_row, column=7)
-                cell_g.value = item['sale_order']
-                cell_g.alignment = center_alignment
-                cell_g.border = thin_border
-                cell_g.font = Font(color="FF0000")
-                
-                current_row += 1
-            current_row += 1
-
-        ws['C1'].value = total_owed
-        ws['C1'].fill = main_header_fill
-        ws['C1'].font = Font(bold=True, size=10, color="000000")
-        ws['C1'].alignment = center_alignment
-        ws['C1'].border = thin_border
-
-        ws['D1'].value = total_available
-        ws['D1'].fill = main_header_fill
-        ws['D1'].font = Font(bold=True, size=10, color="000000")
-        ws['D1'].alignment = center_alignment
-        ws['D1'].border = thin_border
-
-        ws['E1'].value = total_net_balance
-        ws['E1'].fill = main_header_fill
-        ws['E1'].font = main_header_font
-        ws['E1'].alignment = center_alignment
-        ws['E1'].border = thin_border
-
-        excel_file = io.BytesIO()
-        wb.save(excel_file)
-        excel_file.seek(0)
-        file_content = excel_file.read()
-        excel_file.close()
-
-        return file_content
+                writer.write_row([
+                    item['name'],
+                    None,
+                    demand,
+                    available,
+                    net_balance,
+                    item['customers'],
+                    item['sale_order'],
+                ], [
+                    'left',
+                    None,
+                    'left_red' if demand > 0 else 'left',
+                    'center',
+                    'center_red' if net_balance < 0 else 'center',
+                    'center',
+                    'center_red',
+                ])
+            writer.skip_rows()
+
+        return writer.close()
 
     # PAYROLL SCHEDULE REPORT 
-    def _generate_payroll_schedule_report(self):
-        if self.start_date and self.end_date:
-            query = """
-                select hr_pay.id as id, hr_emp.id as emp_id,hr_dep.name as dep_name, hr_emp.staff_id as staff_id, hr_emp.name as emp_name, 
-                hr_pay_line.name as col_name,hr_pay_line.code as code, hr_pay_line.amount as amount,hr_rule.sequence as rule_seq,hr_cat.code as cat_code,
-                hr_cat.name as cat_name
-                from hr_payslip as hr_pay 
-                left join hr_employee as hr_emp on hr_pay.employee_id = hr_emp.id
-                full join hr_department as hr_dep on hr_emp.department_id = hr_dep.id 
-                left join hr_payslip_line as hr_pay_line on hr_pay.id = hr_pay_line.slip_id
-                left join hr_salary_rule as hr_rule on hr_pay_line.salary_rule_id = hr_rule.id
-                left join hr_salary_rule_category as hr_cat on hr_rule.category_id = hr_cat.id
-                where hr_pay.state = 'done' and hr_pay.date_from >= %s and hr_pay.date_to <= %s
-            """
-            params = (self.start_date, self.end_date)
+    def _generate_payroll_schedule_report(self, dataset=None):
+        if dataset:
+            columns = dataset.earning_columns + dataset.deduction_columns
+            rows = self._iter_dataset_schedule_rows(dataset, columns)
         else:
-            query = """
-                select hr_pay.id as id, hr_emp.id as emp_id, hr_dep.name as dep_name,hr_emp.staff_id as staff_id, hr_emp.name as emp_name, 
-                hr_pay_line.name as col_name,hr_pay_line.code as code, hr_pay_line.amount as amount,hr_rule.sequence as rule_seq,hr_cat.code as cat_code,
-                hr_cat.name as cat_name
-                from hr_payslip as hr_pay 
-                left join hr_employee as hr_emp on hr_pay.employee_id = hr_emp.id
-                full join hr_department as hr_dep on hr_emp.department_id = hr_dep.id
-                left join hr_payslip_line as hr_pay_line on hr_pay.id = hr_pay_line.slip_id
-                left join hr_salary_rule as hr_rule on hr_pay_line.salary_rule_id = hr_rule.id
-                left join hr_salary_rule_category as hr_cat on hr_rule.category_id = hr_cat.id
-                where hr_pay.state = 'done'
-            """
-            params = ()
-
-        self.env.cr.execute(query, params)
-        hr_payslips = self.env.cr.dictfetchall()
-
-        columns = set()
-        earning = {}
-        deduction = {}
-
-        for data in hr_payslips:
-            if data['code'] in ('LEAVE','EMYP'):
-                continue
-            
-            col =data['col_name']
-            seq = data.get('rule_seq') or 0
-            category_code = data.get('cat_code') 
-
-            if category_code in ('DED','TAX'):
-                deduction[col] = seq
-            
-            else:
-                earning[col] = seq 
-
-        earning_column = sorted(earning.keys())
-        deduction_column = sorted(deduction.keys())
-        columns = earning_column + deduction_column
-
-        employees = []
-        employee_dict = {} # {emp_id(1): {id:value, staff_id:value, etc..}}
-
-        for payslip in hr_payslips:
-            emp_id = payslip['emp_id']
-
-            if emp_id not in employee_dict: #check the id for repetation
-                employee_dict[emp_id] = {
-                    "id": emp_id,
-                    "staff_id": payslip['staff_id'],
-                    "name": payslip['emp_name'],
-                    "department": payslip['dep_name']['en_US']
-                }
-            
-            employee_data = employee_dict[emp_id] # {id:value, staff_id: value}
-            amount = payslip['amount']
-
-            employee_data[payslip['col_name']] = employee_data.get(payslip['col_name'],0) + amount 
-            
-        total = {}
-        for col in columns:
-            total[col] = 0
-
-        employees = list(employee_dict.values()) #[{id:value,etc...},etc..]
-
-        for emp in employees:
-            for key, val in emp.items():
-                if key in total:
-                    total[key] += val
-         
-        buffer = io.StringIO()
+            # pivoted by the database and streamed to the file
+            summary = self.env['aplus.payroll.summary']
+            columns = summary._get_schedule_columns(self.start_date, self.end_date)
+            rows = iter_query(self.env.cr, *summary._get_schedule_query(columns, self.start_date, self.end_date))
+        report_file = self._write_payroll_schedule(columns, rows, progress=self._report_progress)
+
+        file_name = f"Payroll Schedule Report-{fields.Date.today()}.csv"
+        return file_name, report_file
+
+    @staticmethod
+    def _iter_dataset_schedule_rows(dataset, columns):
+        """ Yield the Payroll Schedule rows of an already loaded dataset, in
+        the shape of aplus.payroll.summary._get_schedule_query. """
+        for emp in dataset.employees.values():
+            yield (False, emp.staff_id, emp.name, emp.department, *(emp.rules.get(col, 0) for col in columns))
+        yield (True, "", "", "", *(dataset.rule_totals.get(col, 0) for col in columns))
+
+    def _write_payroll_schedule(self, columns, rows, progress=None):
+        """ Write the (is_total, staff_id, name, department, *amounts) rows,
+        the earning columns first, then deductions. """
+        report_phase('rendering')
+        report_file = spooled_report_file()
+        buffer = io.TextIOWrapper(report_file, encoding='utf-8', newline='')
         writer = csv.writer(buffer)
         
         writer.writerow(["S/N", "Staff ID", "Employee Name", "Department", *columns])
 
         cnt = 1
-        for emp in employees:
-            row = [
-                cnt,
-                emp.get("staff_id", ""),
-                emp.get("name", ""),
-                emp.get("department", ""),
-            ]
-            
-            for col in columns:
-                row.append(emp.get(col,0))
-            
-            writer.writerow(row)
+        for is_total, staff_id, name, department, *values in rows:
+            if is_total:
+                writer.writerow([cnt, "", "Total", "", *values])
+                continue
+            writer.writerow([cnt, staff_id or "", name or "", department, *values])
+            if progress and cnt % PROGRESS_STEP == 0:
+                progress('rendering', cnt)
             cnt += 1
-        last_row = [cnt,"","Total","",*total.values()]
-        writer.writerow(last_row)
-
-        csv_data = buffer.getvalue().encode()
-        buffer.close()
-
+        report_count('cells_written', (cnt + 1) * (len(columns) + 4))
 
-        self.file_name = f"Payroll Schedule Report-{fields.Date.today()}.csv"
-        
-        self.file_data = base64.b64encode(csv_data)
-        
-        return {
-            'type': 'ir.actions.act_url',
-            'url': f"/web/content/?model={self._name}&id={self.id}&field=file_data&filename={self.file_name}&download=true",
-            'target': 'self',
-        }
+        buffer.flush()
+        buffer.detach()
+        report_file.seek(0)
+        return report_file